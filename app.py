@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 
-import datetime as dt
 import os
 import shutil
 import time
 
 import aws_cdk
 import cdk_monitoring_constructs
-import requests
 import yaml
 from aws_cdk import (
     aws_apigateway as apig,
@@ -21,6 +19,15 @@ from aws_cdk import (
 from aws_cdk import (
     aws_cloudfront_origins as cloudfront_origins,
 )
+from aws_cdk import (
+    aws_cloudwatch as cloudwatch,
+)
+from aws_cdk import (
+    aws_events as events,
+)
+from aws_cdk import (
+    aws_events_targets as events_targets,
+)
 from aws_cdk import (
     aws_iam,
 )
@@ -35,6 +42,8 @@ from aws_cdk import (
 )
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+import changelog
+
 invalidation_code = """
 import os
 import boto3
@@ -108,36 +117,13 @@ class BGToolsStack(aws_cdk.Stack):
                 dirs_exist_ok=True,
             )
 
-        r = requests.get("https://api.github.com/repos/sumpfork/dominiontabs/releases")
-        changelog = r.json()
-        changelog = [
-            {
-                "url": ch["html_url"],
-                "date": dt.datetime.strptime(
-                    ch["published_at"][:10], "%Y-%m-%d"
-                ).date(),
-                "name": ch["name"],
-                "tag": ch["tag_name"],
-                "description": ch["body"],
-            }
-            for ch in changelog
-        ]
-
         env = Environment(
             loader=FileSystemLoader("templates"), autoescape=select_autoescape(["html"])
         )
-        t = env.get_template("changelog.html.j2")
-        generated_template_path = os.path.join(
-            self.lambda_dir, "templates", "generated"
+        changelog.update(
+            env.get_template("changelog.html.j2"),
+            os.path.join(self.lambda_dir, "templates", "generated", "changelog.html"),
         )
-        shutil.rmtree(generated_template_path)
-        os.mkdir(generated_template_path)
-
-        with open(
-            os.path.join(generated_template_path, "changelog.html"),
-            "w",
-        ) as f:
-            f.write(t.render(changelog=changelog))
 
         static_website_bucket = s3.Bucket(
             self,
@@ -164,26 +150,204 @@ class BGToolsStack(aws_cdk.Stack):
             distribution_paths=["/*"],
         )
 
+        # popular configurations (assets/lambda/popular_configs.json), rendered by
+        # the lambda image itself; the handler redirects matching submissions here
+        prebuilt_deployment = s3_deployment.BucketDeployment(
+            self,
+            "Prebuilt PDFs Deployment",
+            sources=[
+                s3_deployment.Source.asset(
+                    self.lambda_dir,
+                    bundling=aws_cdk.BundlingOptions(
+                        image=aws_cdk.DockerImage.from_build(self.lambda_dir),
+                        entrypoint=["python"],
+                        command=["prebuilt.py", "generate", "/asset-output"],
+                        working_directory="/var/task",
+                        environment={"FONT_DIR": self.config.get("FONT_DIR", "")},
+                    ),
+                )
+            ],
+            destination_bucket=static_website_bucket,
+            # prebuilt.PREBUILT_PREFIX
+            destination_key_prefix="prebuilt",
+            content_type="application/pdf",
+            content_disposition='attachment; filename="sumpfork_dominion_dividers.pdf"',
+            distribution=cf_static_dist,
+            distribution_paths=["/prebuilt/*"],
+        )
+
         ca_token = self.config.get("CA_TOKEN")
+        metrics_namespace = f"BGTools-{self.stage}"
 
-        flask_app = lambda_.DockerImageFunction(
+        jobs_bucket = s3.Bucket(
             self,
-            "DominionDividersDockerFlaskApp",
+            "JobsBucket",
+            lifecycle_rules=[s3.LifecycleRule(expiration=aws_cdk.Duration.days(1))],
+            removal_policy=aws_cdk.RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+        )
+        monitoring_facade.monitor_s3_bucket(bucket=jobs_bucket)
+
+        lambda_environment = {
+            "STATIC_WEB_URL": f"https://{cf_static_dist.domain_name}",
+            "FLASK_SECRET_KEY": self.config["SECRET_KEY"],
+            "GA_CONFIG": self.config.get("GA_CONFIG", ""),
+            "LOG_LEVEL": self.config.get("LOG_LEVEL", "INFO"),
+            "FONT_DIR": self.config.get("FONT_DIR", ""),
+            "PREVIEW_FORMAT": self.config.get("PREVIEW_FORMAT", "pdf"),
+            "METRICS_NAMESPACE": metrics_namespace,
+            "JOB_STORE": f"s3://{jobs_bucket.bucket_name}/",
+            # PDFs too large for a lambda response, downloaded via presigned URLs
+            "OFFLOAD_STORE": f"s3://{jobs_bucket.bucket_name}/offload",
+            # pay fonts, artwork and card data during init, not on a request
+            "WARMUP": "1",
+            "WARMUP_LANGUAGES": self.config.get("WARMUP_LANGUAGES", "en_us"),
+            "CARD_DB_LANGUAGES": str(self.config.get("CARD_DB_LANGUAGES", 4)),
+            "PDF_OPTIMIZE": self.config.get("PDF_OPTIMIZE", "0"),
+            # lambda refuses invokes over 6 MB, and API Gateway hands bodies
+            # over base64 encoded, so a raw body can't be much over 4.5 MB
+            "MAX_UPLOAD_MB": str(self.config.get("MAX_UPLOAD_MB", 4)),
+            "MAX_FILE_MB": str(self.config.get("MAX_FILE_MB", 4)),
+        }
+        lambda_code = lambda_.DockerImageCode.from_image_asset(
+            "assets/lambda",
+            build_args={"CA_TOKEN": ca_token} if ca_token else None,
+        )
+
+        memory_size = self.config.get("LAMBDA_MEMORY_SIZE", 1024)
+        job_memory_size = self.config.get("JOB_MEMORY_SIZE", memory_size)
+
+        def parallel_workers(memory_size):
+            # lambda allocates a full vCPU per 1769 MB; forking below that only
+            # makes processes share one core
+            return str(
+                self.config.get(
+                    "PARALLEL_GENERATION_WORKERS", max(1, memory_size // 1769)
+                )
+            )
+
+        # runs background jobs, so large generations aren't bound by the API timeout
+        job_worker = lambda_.DockerImageFunction(
+            self,
+            "DominionDividersJobWorker",
             code=lambda_.DockerImageCode.from_image_asset(
                 "assets/lambda",
                 build_args={"CA_TOKEN": ca_token} if ca_token else None,
+                cmd=["lambda-handlers.job_handler"],
             ),
             environment={
-                "STATIC_WEB_URL": f"https://{cf_static_dist.domain_name}",
-                "FLASK_SECRET_KEY": self.config["SECRET_KEY"],
-                "GA_CONFIG": self.config.get("GA_CONFIG", ""),
-                "LOG_LEVEL": self.config.get("LOG_LEVEL", "INFO"),
-                "FONT_DIR": self.config.get("FONT_DIR", ""),
+                **lambda_environment,
+                "PARALLEL_GENERATION_WORKERS": parallel_workers(job_memory_size),
+            },
+            timeout=aws_cdk.Duration.minutes(
+                self.config.get("JOB_TIMEOUT_MINUTES", 15)
+            ),
+            memory_size=job_memory_size,
+            retry_attempts=0,
+        )
+        monitoring_facade.monitor_lambda_function(lambda_function=job_worker)
+
+        flask_app = lambda_.DockerImageFunction(
+            self,
+            "DominionDividersDockerFlaskApp",
+            code=lambda_code,
+            environment={
+                **lambda_environment,
+                "JOB_WORKER_FUNCTION": job_worker.function_name,
+                # responses are buffered whole, so batches go to the job worker
+                "STREAM_BATCHES": "0",
+                "PARALLEL_GENERATION_WORKERS": parallel_workers(memory_size),
             },
             timeout=aws_cdk.Duration.seconds(60),
-            memory_size=self.config.get("LAMBDA_MEMORY_SIZE", 1024),
+            memory_size=memory_size,
         )
         monitoring_facade.monitor_lambda_function(lambda_function=flask_app)
+        keep_warm_minutes = self.config.get("KEEP_WARM_MINUTES")
+        if keep_warm_minutes:
+            # pinged containers stay warm; the handler answers without Flask
+            events.Rule(
+                self,
+                "KeepWarmSchedule",
+                schedule=events.Schedule.rate(
+                    aws_cdk.Duration.minutes(keep_warm_minutes)
+                ),
+                targets=[
+                    events_targets.LambdaFunction(
+                        flask_app,
+                        event=events.RuleTargetInput.from_object({"keep_warm": True}),
+                        retry_attempts=0,
+                    )
+                ],
+            )
+        jobs_bucket.grant_read_write(flask_app)
+        jobs_bucket.grant_read_write(job_worker)
+        job_worker.grant_invoke(flask_app)
+        # don't redirect to prebuilt PDFs before they are uploaded
+        flask_app.node.add_dependency(prebuilt_deployment)
+
+        # per-phase request timings the handler logs in embedded metric format
+        def phase_metric(name, statistic="p90", unit="ms"):
+            return cloudwatch.Metric(
+                namespace=metrics_namespace,
+                metric_name=name,
+                statistic=statistic,
+                label=f"{name} {statistic} ({unit})",
+                period=aws_cdk.Duration.minutes(5),
+            )
+
+        monitoring_facade.monitor_custom(
+            alarm_friendly_name="RequestPhases",
+            human_readable_name="Request phases",
+            metric_groups=[
+                cdk_monitoring_constructs.CustomMetricGroup(
+                    title="Phase latency (p90)",
+                    metrics=[
+                        phase_metric(name)
+                        for name in [
+                            "parse",
+                            "form",
+                            "clean_options",
+                            "select",
+                            "layout",
+                            "generate",
+                            "encode",
+                            "send_file",
+                            "total",
+                        ]
+                    ],
+                ),
+                cdk_monitoring_constructs.CustomMetricGroup(
+                    title="Peak memory",
+                    metrics=[
+                        phase_metric("PeakRss", "Maximum", "MB"),
+                        phase_metric("PeakRssGrowth", "Maximum", "MB"),
+                    ],
+                ),
+            ],
+        )
+
+        if self.config.get("GENERATION_CACHE_BUCKET"):
+            # shared tier behind the per-container memory and /tmp caches
+            generation_cache_bucket = s3.Bucket(
+                self,
+                "GenerationCacheBucket",
+                lifecycle_rules=[
+                    s3.LifecycleRule(
+                        expiration=aws_cdk.Duration.days(
+                            self.config.get("GENERATION_CACHE_DAYS", 30)
+                        )
+                    )
+                ],
+                removal_policy=aws_cdk.RemovalPolicy.DESTROY,
+                auto_delete_objects=True,
+            )
+            for function in [flask_app, job_worker]:
+                generation_cache_bucket.grant_read_write(function)
+                function.add_environment(
+                    "GENERATION_CACHE_STORE",
+                    f"s3://{generation_cache_bucket.bucket_name}/",
+                )
+            monitoring_facade.monitor_s3_bucket(bucket=generation_cache_bucket)
 
         api = apig.LambdaRestApi(
             self,
@@ -216,6 +380,20 @@ class BGToolsStack(aws_cdk.Stack):
                     self,
                     f"OriginRequestPolicy-{self.stackname}",
                     cookie_behavior=cloudfront.OriginRequestCookieBehavior.all(),
+                    # preview format/dpi are passed as query parameters
+                    query_string_behavior=cloudfront.OriginRequestQueryStringBehavior.all(),
+                ),
+                # pages send their own Cache-Control; responses without one (job
+                # status and results) aren't cached
+                cache_policy=cloudfront.CachePolicy(
+                    self,
+                    f"CachePolicy-{self.stackname}",
+                    default_ttl=aws_cdk.Duration.seconds(0),
+                    min_ttl=aws_cdk.Duration.seconds(0),
+                    max_ttl=aws_cdk.Duration.days(1),
+                    query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+                    enable_accept_encoding_gzip=True,
+                    enable_accept_encoding_brotli=True,
                 ),
                 allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
             ),
@@ -0,0 +1,199 @@
+"""Tab artwork at a resolution that fits the output.
+
+domdiv's tab banners are page-wide 300 dpi PNGs that are decoded and
+downsampled for every new tab size. ``python artwork_tiers.py`` (run at
+image build time) writes copies pre-scaled to each of TIERS into
+ARTWORK_DIR, then renders a few reference divider sets at each tier and
+records their PDF sizes in the manifest.
+
+Previews draw at the lowest tier. Full outputs draw at the highest tier
+whose estimated size for the selected number of cards fits in
+ARTWORK_SIZE_BUDGET_MB, which defaults to what fits in a Lambda response.
+Without a manifest, outputs fall back to 300 dpi from the original files.
+"""
+
+import json
+import os
+import sys
+import time
+
+import domdiv
+from domdiv import resource_handling
+from domdiv.draw import DividerDrawer
+from image_pipeline import target_size
+from loguru import logger
+from PIL import Image
+
+ARTWORK_DIR = os.environ.get(
+    "ARTWORK_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "artwork"),
+)
+MANIFEST_PATH = os.path.join(ARTWORK_DIR, "manifest.json")
+TIERS = [72, 150, 300, 600]
+PREVIEW_TIER = TIERS[0]
+DEFAULT_TIER = 300
+# placeholder resolution, replaced per render once the cards are known
+AUTO = -1
+# lambda responses are at most 6 MB, base64 encoded
+SIZE_BUDGET = float(os.environ.get("ARTWORK_SIZE_BUDGET_MB", 4)) * 2**20
+# layout options (tab width, wrappers) move sizes away from the reference sets
+SIZE_MARGIN = 1.25
+# a banner is at most a page wide and a tab high
+ARTWORK_FACE_CM = (21.0, 3.6)
+# number of expansions in each reference set
+CALIBRATION_EXPANSIONS = [1, 4, 12, None]
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"no artwork manifest at {path}, using the original artwork")
+        return None
+    if manifest.get("domdiv_version") != domdiv.__version__:
+        logger.warning(
+            f"artwork manifest is for domdiv {manifest.get('domdiv_version')}, "
+            f"have {domdiv.__version__}; using the original artwork"
+        )
+        return None
+    return manifest
+
+
+_manifest = load_manifest()
+
+
+def estimate_size(points, cards):
+    """Interpolate a tier's ``[cards, bytes]`` reference points.
+
+    Past either end the nearest segment is extended.
+    """
+    for (c1, b1), (c2, b2) in zip(points, points[1:]):
+        if cards <= c2:
+            break
+    return b1 + (cards - c1) * (b2 - b1) / (c2 - c1)
+
+
+def pick_tier(cards, budget=SIZE_BUDGET, manifest=None):
+    manifest = manifest or _manifest
+    if manifest is None:
+        return DEFAULT_TIER
+    fits = [
+        tier
+        for tier in TIERS
+        if estimate_size(manifest["tiers"][str(tier)]["sizes"], cards) * SIZE_MARGIN
+        <= budget
+    ]
+    return max(fits, default=TIERS[0])
+
+
+def cache_key():
+    """What tier picking depends on besides the options, for generation cache keys."""
+    sizes = {
+        tier: entry["sizes"]
+        for tier, entry in (_manifest or {}).get("tiers", {}).items()
+    }
+    return {"budget": SIZE_BUDGET, "sizes": sizes}
+
+
+def tier_file(image, resolution):
+    """Path of the smallest pre-scaled copy of ``image`` good for ``resolution``."""
+    if _manifest is None or resolution <= 0:
+        return None
+    for tier in TIERS:
+        if tier < resolution:
+            continue
+        name = _manifest["tiers"][str(tier)]["files"].get(image)
+        # tiers without a copy draw from the original
+        return os.path.join(ARTWORK_DIR, name) if name else None
+    return None
+
+
+_prep_artwork = DividerDrawer.prepArtwork
+
+
+def prep_artwork(image, w, h, resolution, opacity):
+    # domdiv resolves image names under its images directory, which leaves
+    # absolute paths alone
+    return _prep_artwork(
+        tier_file(image, resolution) or image, w, h, resolution, opacity
+    )
+
+
+def install():
+    DividerDrawer.prepArtwork = staticmethod(prep_artwork)
+
+
+def artwork_images():
+    from domdiv.cards import CardType
+
+    with resource_handling.get_resource_stream("card_db/types_db.json.gz") as f:
+        types = json.loads(f.read().decode("utf-8"), object_hook=CardType.decode_json)
+    return sorted({t.getTabImageFile() for t in types if t.getTabImageFile()})
+
+
+def write_tier(tier, images):
+    files = {}
+    os.makedirs(os.path.join(ARTWORK_DIR, str(tier)), exist_ok=True)
+    for image in images:
+        with Image.open(resource_handling.get_image_filepath(image)) as original:
+            size = target_size(original.size, ARTWORK_FACE_CM, tier)
+            if size == original.size:
+                continue
+            name = os.path.join(str(tier), image)
+            original.resize(size, Image.LANCZOS).save(os.path.join(ARTWORK_DIR, name))
+            files[image] = name
+    logger.info(f"pre-scaled {len(files)} of {len(images)} banners to {tier} dpi")
+    return files
+
+
+def reference_sizes(tier):
+    # rendering needs the forms, which import this module
+    import generation
+
+    sizes = []
+    with generation.standalone_app().app_context():
+        expansions = generation.FORMS["dominion_dividers"].expansion_choices
+        for count in CALIBRATION_EXPANSIONS:
+            form, _ = generation.make_form(
+                {
+                    "tag": "dominion_dividers",
+                    "form": {"expansions": expansions[:count]},
+                    "files": {},
+                }
+            )
+            assert form.validate(), form.errors
+            cards = len(form.select_cards(form.clean_options()))
+            options = form.clean_options()
+            options.tab_artwork_resolution = tier
+            start = time.perf_counter()
+            pdf = form.render(options)
+            sizes.append([cards, len(pdf)])
+            logger.info(
+                f"{count or 'all'} expansions at {tier} dpi: "
+                f"{cards} cards, {len(pdf)} bytes "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+    return sizes
+
+
+def write_manifest(path=MANIFEST_PATH):
+    global _manifest
+    images = artwork_images()
+    manifest = {"domdiv_version": domdiv.__version__, "tiers": {}}
+    for tier in TIERS:
+        manifest["tiers"][str(tier)] = {"files": write_tier(tier, images)}
+    # reference renders draw from the copies just written
+    _manifest = manifest
+    for tier in TIERS:
+        manifest["tiers"][str(tier)]["sizes"] = reference_sizes(tier)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    logger.info(f"wrote artwork manifest for domdiv {domdiv.__version__} to {path}")
+
+
+if __name__ == "__main__":
+    # the forms install prep_artwork from artwork_tiers, not from __main__
+    import artwork_tiers
+
+    artwork_tiers.write_manifest(*sys.argv[1:])
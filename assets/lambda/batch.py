@@ -0,0 +1,95 @@
+"""Generate several variants of one divider configuration into a ZIP archive."""
+
+import io
+import re
+import zipfile
+
+# form fields a batch can vary, one PDF per value
+VARIANT_FIELDS = ["expansions", "language", "pagesize"]
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def variant_values(form, field, values):
+    if field not in VARIANT_FIELDS:
+        raise InvalidBatch(f"can't vary {field}")
+    if not values and field == "expansions":
+        # one PDF per expansion selected on the form, or per expansion overall
+        values = form.expansions.data or form.expansion_choices
+    if not values:
+        raise InvalidBatch(f"no values given for {field}")
+    choices = {value for value, _ in form[field].choices}
+    unknown = [value for value in values if value not in choices]
+    if unknown:
+        raise InvalidBatch(f"unknown {field}: {', '.join(unknown)}")
+    return values
+
+
+def variant_data(field, value):
+    return [value] if field == "expansions" else value
+
+
+def variant_filename(value):
+    value = re.sub(r"[^\w.-]+", "_", value)
+    return f"sumpfork_dominion_dividers_{value}.pdf"
+
+
+def zip_filename(field):
+    return f"sumpfork_dominion_dividers_by_{field}.zip"
+
+
+def variant_submissions(submission):
+    """The captured submission of each variant of a batch job's submission."""
+    field = submission["batch"]["field"]
+    for value in submission["batch"]["values"]:
+        data = variant_data(field, value)
+        form = dict(
+            submission["form"], **{field: data if isinstance(data, list) else [data]}
+        )
+        variant = {k: v for k, v in submission.items() if k != "batch"}
+        yield value, dict(variant, form=form)
+
+
+def generate_zip(submission, generate):
+    """The ZIP archive of a batch job, generating each variant with ``generate``."""
+    files = (
+        (variant_filename(value), generate(variant).getvalue())
+        for value, variant in variant_submissions(submission)
+    )
+    return b"".join(zip_stream(files))
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Write-only stream that hands out whatever was written since the last call."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_stream(files):
+    """Yield a ZIP archive of ``(name, data)`` pairs as it is built.
+
+    Entries are written as they come in, so only one PDF is held at a time.
+    PDFs barely deflate, so they are stored as is.
+    """
+    writer = _ChunkWriter()
+    # an unseekable output makes zipfile write sizes after each entry
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield writer.take()
+    yield writer.take()
@@ -0,0 +1,176 @@
+"""Keep the parsed card database in memory for the life of the process.
+
+``db.read_card_data`` parses the card, type and set databases on every call
+and ``filter_sort_cards`` reads two languages' text files on top. Both only
+depend on the installed domdiv release, a handful of options and the
+language, so the parsed result is kept (pickled, every request gets its own
+copy to mutate) and language text is kept for the CARD_DB_LANGUAGES most
+recently used languages.
+
+On top of that, ``select_cards`` keeps the result of ``filter_sort_cards``
+for the options it reads (SELECT_OPTIONS), so that changing only layout
+options (tab width, gaps, line type, back offset...) reuses the selected
+cards. tests/test_card_selection_keys.py traces which options domdiv reads
+and writes while selecting and fails if the lists below miss any, so a
+domdiv upgrade can't silently serve stale selections.
+"""
+
+import copy
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from importlib.metadata import version
+
+import domdiv.main
+from domdiv import db, resource_handling
+from domdiv.cards import Card
+from generation_cache import options_digest
+from loguru import logger
+
+DOMDIV_VERSION = version("domdiv")
+MAX_LANGUAGES = int(os.environ.get("CARD_DB_LANGUAGES", 4))
+# options read_card_data applies while loading; there are only a few combinations
+READ_OPTIONS = ["no_trash", "curse10", "include_blanks", "start_decks"]
+MAX_SNAPSHOTS = 8
+TEXT_KINDS = ["cards", "sets", "types", "bonuses"]
+# options filter_sort_cards reads, besides READ_OPTIONS
+SELECT_OPTIONS = [
+    "base_cards_with_expansion",
+    "cardlist",
+    "edition",
+    "exclude_expansions",
+    "expansion_dividers",
+    "expansion_dividers_long_name",
+    "expansions",
+    "fan",
+    "group_global",
+    "group_kingdom",
+    "group_special",
+    "language",
+    "only_type_all",
+    "only_type_any",
+    "order",
+    "upgrade_with_expansion",
+]
+# options filter_sort_cards rewrites, which layout and drawing read back
+SELECTED_OPTIONS = ["exclude_expansions", "expansions", "fan"]
+MAX_SELECTIONS = int(os.environ.get("CARD_SELECTIONS", 16))
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()
+_languages = OrderedDict()
+_selections = OrderedDict()
+
+
+def _remember(entries, key, value, limit):
+    with _lock:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            evicted, _ = entries.popitem(last=False)
+            logger.info(f"dropping cached card data for {evicted}")
+
+
+def _recall(entries, key):
+    with _lock:
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+        return value
+
+
+def read_card_data(options):
+    """``db.read_card_data``, parsing the databases once per process."""
+    key = (DOMDIV_VERSION,) + tuple(getattr(options, name) for name in READ_OPTIONS)
+    snapshot = _recall(_snapshots, key)
+    if snapshot is None:
+        cards = db.read_card_data(options)
+        snapshot = pickle.dumps(
+            (cards, Card.types, Card.type_names, Card.sets),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        _remember(_snapshots, key, snapshot, MAX_SNAPSHOTS)
+    cards, Card.types, Card.type_names, Card.sets = pickle.loads(snapshot)
+    # domdiv only ever appends to this, across requests and languages
+    Card.bonus_regex = None
+    return cards
+
+
+def select_cards(options):
+    """``read_card_data`` then ``filter_sort_cards``, cached on the options read."""
+    key = options_digest(
+        {name: getattr(options, name) for name in READ_OPTIONS + SELECT_OPTIONS},
+        domdiv_version=DOMDIV_VERSION,
+    )
+    snapshot = _recall(_selections, key)
+    if snapshot is None:
+        cards = domdiv.main.filter_sort_cards(read_card_data(options), options)
+        selected = {name: getattr(options, name) for name in SELECTED_OPTIONS}
+        snapshot = pickle.dumps(
+            (cards, Card.types, Card.type_names, Card.sets, Card.bonus_regex, selected),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        _remember(_selections, key, snapshot, MAX_SELECTIONS)
+    cards, Card.types, Card.type_names, Card.sets, Card.bonus_regex, selected = (
+        pickle.loads(snapshot)
+    )
+    for name, value in selected.items():
+        setattr(options, name, value)
+    return cards
+
+
+def language_text(kind, language):
+    language = language.lower()
+    key = (DOMDIV_VERSION, language)
+    texts = _recall(_languages, key)
+    if texts is None:
+        texts = {}
+        for name in TEXT_KINDS:
+            path = os.path.join("card_db", language, f"{name}_{language}.json.gz")
+            with resource_handling.get_resource_stream(path) as f:
+                texts[name] = json.loads(f.read().decode("utf-8"))
+        _remember(_languages, key, texts, MAX_LANGUAGES)
+    return texts[kind]
+
+
+# drop-in replacements for the loaders filter_sort_cards calls by name
+
+
+def add_card_text(cards, language="en_us"):
+    card_text = language_text("cards", language)
+    for card in cards:
+        text = card_text.get(card.card_tag, {})
+        if "name" in text:
+            card.name = text["name"]
+        if "description" in text:
+            card.description = text["description"]
+        if "extra" in text:
+            card.extra = text["extra"]
+    return cards
+
+
+def add_set_text(options, sets, language="en_us"):
+    set_text = language_text("sets", language)
+    for s in sets:
+        if s in set_text:
+            sets[s].update(set_text[s])
+    return sets
+
+
+def add_type_text(types=None, language="en_us"):
+    if types is None:
+        types = {}
+    types.update(language_text("types", language))
+    return types
+
+
+def add_bonus_regex(options, language="en_us"):
+    # Card.addBonusRegex sorts and fills in the dict it is given
+    return copy.deepcopy(language_text("bonuses", language))
+
+
+def install():
+    for loader in [add_card_text, add_set_text, add_type_text, add_bonus_regex]:
+        setattr(domdiv.main, loader.__name__, loader)
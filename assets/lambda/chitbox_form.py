@@ -1,4 +1,5 @@
 from io import BytesIO
+from importlib.metadata import version
 
 import wtforms.fields as wtf_fields
 from wtforms import validators
@@ -7,6 +8,14 @@ from flask_wtf.file import FileField as FlaskFileField, FileAllowed
 from flask_uploads import IMAGES
 from chitboxes.chitboxes import ChitBoxGenerator
 
+from generation_cache import form_digest, generation_cache
+from image_pipeline import PixelBudget, normalize_files
+import pdf_optimize
+from timing import phase
+
+CHITBOXES_VERSION = version("chitboxes")
+IMAGE_FIELDS = ["main_image", "side_image"]
+
 
 class ChitboxForm(FlaskForm):
     width = wtf_fields.DecimalField(
@@ -25,25 +34,50 @@ class ChitboxForm(FlaskForm):
         default=2,
     )
     main_image = FlaskFileField(
-        label="Upload Main Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload Main Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
     side_image = FlaskFileField(
-        label="Upload Side Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload Side Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
 
     def generate(self, files=None, **kwargs):
         if files is None:
             files = {}
+        key = form_digest(
+            self,
+            files,
+            IMAGE_FIELDS,
+            kind="chitbox",
+            optimize=pdf_optimize.PDF_OPTIMIZE,
+            generator_version=CHITBOXES_VERSION,
+        )
+        pdf = generation_cache.get_or_generate(
+            key, lambda: pdf_optimize.maybe_optimize(self.render(files))
+        )
+        return BytesIO(pdf)
 
+    def render(self, files):
         buf = BytesIO()
+        width = float(self["width"].data)
+        length = float(self["length"].data)
+        height = float(self["height"].data)
+        images = normalize_files(
+            files,
+            {
+                "main_image": (width, length),
+                "side_image": (max(width, length), height),
+            },
+        )
         c = ChitBoxGenerator.fromRawData(
-            float(self["width"].data),
-            float(self["length"].data),
-            float(self["height"].data),
+            width,
+            length,
+            height,
             buf,
-            files.get("main_image"),
-            files.get("side_image"),
+            images.get("main_image"),
+            images.get("side_image"),
         )
-        c.generate()
-        buf.seek(0)
-        return buf
+        with phase("generate"):
+            c.generate()
+        return buf.getvalue()
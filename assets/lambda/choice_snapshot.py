@@ -0,0 +1,85 @@
+"""DomDivForm choice lists, snapshotted at image build time (``python choice_snapshot.py``)
+so cold starts skip reading the card database; ignored if domdiv's version changed.
+"""
+
+import json
+import os
+import sys
+
+import domdiv
+from domdiv import db
+from loguru import logger
+
+SNAPSHOT_PATH = os.environ.get(
+    "DOMDIV_CHOICE_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "choice_snapshot.json"),
+)
+
+# suffixes of expansion keys that get a nicer display name
+REPLACEMENTS = {
+    "1stedition": "1st Edition",
+    "1steditionremoved": "cards removed in 2nd edition",
+    "2ndeditionupgrade": "2nd Edition Upgrade",
+    "andguilds2ndedition": "and Guilds 2nd Edition",
+    "2ndedition": "2nd Edition",
+    "-bigbox2-de": "(Deutsche Big Box v2)",
+    "risingsun": "Rising Sun",
+}
+
+
+def pretty_names(choices):
+    names = []
+    for choice in choices:
+        for s, r in REPLACEMENTS.items():
+            if choice.lower().endswith(s):
+                names.append("{} {}".format(choice[: -len(s)].capitalize(), r))
+                break
+        else:
+            names.append(choice.capitalize())
+    return names
+
+
+def compute_choices():
+    expansion_choices, fan_choices = db.get_expansions()
+    expansion_choices = [
+        choice for choice in expansion_choices if choice.lower() != "extras"
+    ]
+    _, label_keys, label_selections, _ = db.get_label_data()
+    group_global_choices, _ = db.get_global_groups()
+    return {
+        "expansions": list(zip(expansion_choices, pretty_names(expansion_choices))),
+        "fan": list(zip(fan_choices, pretty_names(fan_choices))),
+        "labels": list(zip(label_keys, label_selections)),
+        "group_global": [(c, c.capitalize()) for c in group_global_choices],
+        "languages": list(db.get_languages()),
+    }
+
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    snapshot = {"domdiv_version": domdiv.__version__, "choices": compute_choices()}
+    with open(path, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    logger.info(f"wrote choice snapshot for domdiv {domdiv.__version__} to {path}")
+
+
+def load_choices(path=SNAPSHOT_PATH):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"no choice snapshot at {path}, computing choices")
+        return compute_choices()
+    if snapshot.get("domdiv_version") != domdiv.__version__:
+        logger.warning(
+            f"choice snapshot is for domdiv {snapshot.get('domdiv_version')}, "
+            f"have {domdiv.__version__}; computing choices"
+        )
+        return compute_choices()
+    choices = snapshot["choices"]
+    for name in ["expansions", "fan", "labels", "group_global"]:
+        choices[name] = [tuple(choice) for choice in choices[name]]
+    return choices
+
+
+if __name__ == "__main__":
+    write_snapshot(*sys.argv[1:])
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event()}
+        if not leader:
+            logger.info(f"waiting on in-flight generation for {key[:12]}")
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+
+
+class PreviewVersions:
+    """Newest preview sequence number seen per browser, so stale previews can be dropped.
+
+    This is per process: it catches the bursts that queue up in a threaded or
+    pooled server and in a warm container, not requests spread across containers.
+    """
+
+    def __init__(self, max_clients=4096):
+        self.max_clients = max_clients
+        self.latest = OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, client, seq):
+        with self.lock:
+            latest = max(self.latest.get(client, seq), seq)
+            self.latest[client] = latest
+            self.latest.move_to_end(client)
+            while len(self.latest) > self.max_clients:
+                self.latest.popitem(last=False)
+        return seq >= latest
+
+    def is_current(self, client, seq):
+        with self.lock:
+            return seq >= self.latest.get(client, seq)
+
+
+preview_versions = PreviewVersions()
@@ -1,11 +1,22 @@
 import argparse
+import copy
 from io import BytesIO
 
+import artwork_tiers
+import card_db_cache
 import domdiv.main
+import parallel_render
+import pdf_optimize
 import wtforms.fields as wtf_fields
-from domdiv import config_options, db
+from choice_snapshot import load_choices
+from domdiv import config_options
 from flask_wtf import FlaskForm
+from generation_cache import generation_cache, options_digest
 from loguru import logger
+from timing import phase
+
+artwork_tiers.install()
+card_db_cache.install()
 
 PAPER_SIZES = ["Letter", "Legal", "A4", "A3"]
 TAB_SIDE_SELECTION = {
@@ -27,48 +38,89 @@ TAB_NUMBER_SELECTION = {
 }
 
 
+_default_options = None
+
+
+def default_options():
+    """A copy of domdiv's default options; argparse only runs once."""
+    global _default_options
+    if _default_options is None:
+        _default_options = config_options.parse_opts([])
+    # each request's options are mutated all through generation
+    return copy.deepcopy(_default_options)
+
+
+def build_options(values, expansion_choices, font_dir=None):
+    """Cleaned domdiv options from form field values, in form field order."""
+    options = default_options()
+    is_label = False
+    for option, value in values.items():
+        if option == "tab_number":
+            value = int(value)
+
+        if option in ["expansions", "fan", "group_global"]:
+            if option == "expansions" and not value:
+                value = expansion_choices
+            value = [[v] for v in value]
+
+        if option == "cardsize":
+            options.size = "unsleeved" if "Unsleeved" in value else "sleeved"
+            options.sleeved_thick = "Thick" in option
+            options.sleeved_thin = "Thin" in option
+        elif option == "pagesize":
+            if value in PAPER_SIZES:
+                options.papersize = value
+                options.label_name = None
+            else:
+                options.label_name = value
+                options.papersize = "letter"
+                options.wrapper_meta = False
+                options.notch = False
+                options.cropmarks = False
+                is_label = True
+        elif option == "wrappers":
+            value = value.lower()
+
+            if value == "slipcases":
+                options.wrapper_meta = True
+            elif value == "pulltabs":
+                options.pull_tab_meta = True
+            elif value == "tents":
+                options.tent_meta = True
+            else:
+                assert value == "dividers"
+        else:
+            assert hasattr(options, option), f"{option} is not a script option"
+            if is_label and option in ["wrapper", "notch", "cropmarks"]:
+                continue
+            setattr(options, option, value)
+
+    if not options.group_global:
+        options.group_global = None
+    if options.group_global or options.include_blanks:
+        options.expansions += [["extras"]]
+
+    # picked per render to fit lambda's response size limit
+    options.tab_artwork_resolution = artwork_tiers.AUTO
+
+    if font_dir:
+        options.font_dir = font_dir
+    return config_options.clean_opts(options)
+
+
 class DomDivForm(FlaskForm):
     # Expansions
-    expansion_choices, fan_choices = db.get_expansions()
-
-    expansion_choices = [
-        choice for choice in expansion_choices if choice.lower() != "extras"
-    ]
-    # make pretty names for the expansion choices
-    choiceNames = []
-    replacements = {
-        "1stedition": "1st Edition",
-        "1steditionremoved": "cards removed in 2nd edition",
-        "2ndeditionupgrade": "2nd Edition Upgrade",
-        "andguilds2ndedition": "and Guilds 2nd Edition",
-        "2ndedition": "2nd Edition",
-        "-bigbox2-de": "(Deutsche Big Box v2)",
-        "risingsun": "Rising Sun",
-    }
-    for choice in expansion_choices:
-        for s, r in replacements.items():
-            if choice.lower().endswith(s):
-                choiceNames.append("{} {}".format(choice[: -len(s)].capitalize(), r))
-                break
-        else:
-            choiceNames.append(choice.capitalize())
+    choices = load_choices()
+    expansion_choices = [choice for choice, _ in choices["expansions"]]
     expansions = wtf_fields.SelectMultipleField(
         label="Expansions to Include (Cmd/Ctrl click to select multiple)",
-        choices=list(zip(expansion_choices, choiceNames)),
+        choices=choices["expansions"],
         default=["dominion2ndEdition"],
     )
     # Now Fan expansions
-    # make pretty names for the expansion choices
-    choiceNames = []
-    for choice in fan_choices:
-        for s, r in replacements.items():
-            if choice.lower().endswith(s):
-                choiceNames.append("{} {}".format(choice[: -len(s)].capitalize(), r))
-                break
-        else:
-            choiceNames.append(choice.capitalize())
+    fan_choices = [choice for choice, _ in choices["fan"]]
     fan = wtf_fields.SelectMultipleField(
-        choices=list(zip(fan_choices, choiceNames)),
+        choices=choices["fan"],
         label="Fan Expansions to Include (Cmd/Ctrl click to select multiple)",
     )
     orientation = wtf_fields.SelectField(
@@ -77,15 +129,10 @@ class DomDivForm(FlaskForm):
         default="horizontal",
     )
 
-    _, label_keys, label_selections, _ = db.get_label_data()
+    label_keys = [key for key, _ in choices["labels"]]
     pagesize = wtf_fields.SelectField(
         label="Paper Size",
-        choices=list(
-            zip(
-                PAPER_SIZES + label_keys,
-                PAPER_SIZES + label_selections,
-            )
-        ),
+        choices=list(zip(PAPER_SIZES, PAPER_SIZES)) + choices["labels"],
         default="Letter",
     )
 
@@ -194,13 +241,9 @@ class DomDivForm(FlaskForm):
         label="Group cards without randomizers separately", default=False
     )
     # global grouping
-    group_global_choices, _ = db.get_global_groups()
-    # make pretty names for the global group choices
-    choiceNames = []
-    for choice in group_global_choices:
-        choiceNames.append(choice.capitalize())
+    group_global_choices = [choice for choice, _ in choices["group_global"]]
     group_global = wtf_fields.SelectMultipleField(
-        choices=list(zip(group_global_choices, choiceNames)),
+        choices=choices["group_global"],
         label="Group these card types globally (Cmd/Ctrl click to select multiple)",
         default="",
     )
@@ -236,7 +279,7 @@ class DomDivForm(FlaskForm):
         label="Cost Icon Location",
         default="tab",
     )
-    language_choices = db.get_languages()
+    language_choices = choices["languages"]
     language = wtf_fields.SelectField(
         choices=list(zip(language_choices, language_choices)),
         label="Language",
@@ -272,83 +315,95 @@ class DomDivForm(FlaskForm):
     def clean_options(self):
         form_options = argparse.Namespace()
         self.populate_obj(form_options)
-        options = config_options.parse_opts([])
-        logger.info(f"valid options: {sorted(list(vars(options).keys()))}")
-        is_label = False
-        for option, value in vars(form_options).items():
-            # option = option.replace('_', '-')
-            logger.info(f"option {option} ({type(option)}): {value}")
-            if option == "tab_number":
-                value = int(value)
-
-            if option in ["expansions", "fan", "group_global"]:
-                if option == "expansions" and not value:
-                    value = self.expansion_choices
-                value = [[v] for v in value]
-
-            if option == "cardsize":
-                logger.info("handling cardsize")
-                options.size = "unsleeved" if "Unsleeved" in value else "sleeved"
-                options.sleeved_thick = "Thick" in option
-                options.sleeved_thin = "Thin" in option
-            elif option == "pagesize":
-                logger.info("handling pagesize")
-                if value in PAPER_SIZES:
-                    options.papersize = value
-                    options.label_name = None
-                else:
-                    options.label_name = value
-                    options.papersize = "letter"
-                    options.wrapper_meta = False
-                    options.notch = False
-                    options.cropmarks = False
-                    is_label = True
-            elif option == "wrappers":
-                value = value.lower()
-
-                if value == "slipcases":
-                    options.wrapper_meta = True
-                elif value == "pulltabs":
-                    options.pull_tab_meta = True
-                elif value == "tents":
-                    options.tent_meta = True
-                else:
-                    assert value == "dividers"
-            else:
-                assert hasattr(options, option), f"{option} is not a script option"
-                if is_label and option in ["wrapper", "notch", "cropmarks"]:
-                    logger.info(f"skipping {option} because we're printing labels")
-                    continue
-                logger.info(f"{option} --> {value}")
-                options.__setattr__(option, value)
-
-        if not options.group_global:
-            options.group_global = None
-        if options.group_global or options.include_blanks:
-            options.expansions += [["extras"]]
-
-        # force dpi due to lambda return size constraints
-        options.tab_artwork_resolution = 300
-
         if self.font_dir:
             logger.info(f"setting font dir to {self.font_dir}")
-            options.font_dir = self.font_dir
         else:
             logger.warning("no local font dir")
-
-        logger.info(f"options after populate: {options}")
-        options = config_options.clean_opts(options)
+        options = build_options(
+            vars(form_options), self.expansion_choices, self.font_dir
+        )
         logger.info(f"options after cleaning: {options}")
         return options
 
-    def generate(self, num_pages=None, **kwargs):
-        options = self.clean_options()
+    def generate(self, num_pages=None, preview=False, **kwargs):
+        with phase("clean_options"):
+            options = self.clean_options()
+        return DomDivForm.generate_options(options, num_pages, preview)
+
+    @staticmethod
+    def generate_options(options, num_pages=None, preview=False):
+        """The PDF for cleaned ``options``, from the generation cache if it's there."""
         if num_pages is not None:
             options.num_pages = num_pages
+        if preview:
+            options.tab_artwork_resolution = artwork_tiers.PREVIEW_TIER
+
+        key = options_digest(
+            options,
+            domdiv_version=domdiv.__version__,
+            artwork=artwork_tiers.cache_key(),
+            preview=preview,
+            optimize=pdf_optimize.PDF_OPTIMIZE,
+        )
 
-        buf = BytesIO()
-        options.outfile = buf
-        domdiv.main.generate(options)
+        def render():
+            if preview:
+                # shown once and thrown away, not worth the optimize pass
+                return DomDivForm.render(options, preview=True)
+            return pdf_optimize.maybe_optimize(DomDivForm.render(options))
+
+        pdf = generation_cache.get_or_generate(key, render)
         logger.info("done generation, returning pdf")
-        buf.seek(0)
-        return buf
+        return BytesIO(pdf)
+
+    @staticmethod
+    def select_cards(options):
+        cards = card_db_cache.select_cards(options)
+        assert cards, "No cards after filtering/sorting"
+        return cards
+
+    @staticmethod
+    def first_pages(options, cards):
+        """Enough cards to lay out the first ``options.num_pages`` pages as in full."""
+        # every wrapper is made as tall as the one for the thickest stack
+        thickest = None
+        if options.wrapper:
+            thickest = max(cards, key=lambda c: c.getStackHeight(options.thickness))
+        # laying out one card is enough to know how many fit on a page
+        probe = domdiv.main.calculate_layout(
+            copy.deepcopy(options), [thickest or cards[0]]
+        )
+        per_page = (
+            probe.options.numDividersHorizontal * probe.options.numDividersVertical
+        )
+        first = cards[: per_page * options.num_pages]
+        if thickest is not None and not any(card is thickest for card in first):
+            # on a page after the ones drawn, it only sets the height
+            first.append(thickest)
+        return first
+
+    @staticmethod
+    def render(options, preview=False):
+        """The PDF for ``options``; a preview only has the fronts of the first pages."""
+        options.outfile = BytesIO()
+        # domdiv.main.generate in stages: selecting the cards is cached on the
+        # options it reads, layout is cheap, the whole PDF is cached by generate
+        with phase("select"):
+            cards = DomDivForm.select_cards(options)
+        with phase("layout"):
+            if options.num_pages is not None and options.num_pages > 0:
+                # tabs and pages only depend on the cards before them
+                cards = DomDivForm.first_pages(options, cards)
+            if options.tab_artwork_resolution == artwork_tiers.AUTO:
+                options.tab_artwork_resolution = artwork_tiers.pick_tier(len(cards))
+                logger.info(
+                    f"drawing artwork for {len(cards)} cards at "
+                    f"{options.tab_artwork_resolution} dpi"
+                )
+            dd = domdiv.main.calculate_layout(options, cards)
+        if preview:
+            # the dividers keep their back text, which flipped tabs show in front
+            dd.options.text_back = "none"
+        with phase("generate"):
+            parallel_render.draw(dd, cards)
+        return dd.options.outfile.getvalue()
@@ -0,0 +1,89 @@
+"""Run form generation from a plain, serializable description of a submission.
+
+Job workers and pooled server workers don't have the original request, so a
+submission is captured as its form fields plus raw upload bytes and rebuilt
+into the matching form here.
+"""
+
+import base64
+import os
+from io import BytesIO
+
+from chitbox_form import ChitboxForm
+from domdiv_form import DomDivForm
+from flask import Flask, has_app_context
+from tuckbox_form import TuckboxForm
+from werkzeug.datastructures import CombinedMultiDict, FileStorage, MultiDict
+
+FORMS = {
+    "dominion_dividers": DomDivForm,
+    "tuckboxes": TuckboxForm,
+    "chitboxes": ChitboxForm,
+}
+DOWNLOAD_NAMES = {
+    "dominion_dividers": "sumpfork_dominion_dividers.pdf",
+    "tuckboxes": "sumpfork_tuckbox.pdf",
+    "chitboxes": "sumpfork_chitbox.pdf",
+}
+
+_standalone_app = None
+
+
+class InvalidSubmission(ValueError):
+    pass
+
+
+def standalone_app():
+    # forms need an app context for their config, even outside of a request
+    global _standalone_app
+    if _standalone_app is None:
+        _standalone_app = Flask(__name__)
+        _standalone_app.config["WTF_CSRF_ENABLED"] = False
+    return _standalone_app
+
+
+def capture(tag, form, files):
+    """Describe a request's submission in a JSON-serializable dict."""
+    return {
+        "tag": tag,
+        "form": form.to_dict(flat=False),
+        "files": {
+            name: {
+                "filename": f.filename,
+                "content_type": f.content_type,
+                "data": base64.b64encode(f.read()).decode("ascii"),
+            }
+            for name, f in files.items()
+            if f and f.filename
+        },
+    }
+
+
+def make_form(submission):
+    form_class = FORMS[submission["tag"]]
+    files = MultiDict(
+        {
+            name: FileStorage(
+                BytesIO(base64.b64decode(f["data"])),
+                filename=f["filename"],
+                name=name,
+                content_type=f["content_type"],
+            )
+            for name, f in submission["files"].items()
+        }
+    )
+    formdata = CombinedMultiDict([files, MultiDict(submission["form"])])
+    kwargs = {}
+    if form_class is DomDivForm:
+        kwargs["font_dir"] = os.environ.get("FONT_DIR")
+    return form_class(formdata=formdata, **kwargs), files
+
+
+def generate(submission, **kwargs):
+    if not has_app_context():
+        with standalone_app().app_context():
+            return generate(submission, **kwargs)
+    form, files = make_form(submission)
+    if not form.validate():
+        raise InvalidSubmission(form.errors)
+    return form.generate(files=files, **kwargs)
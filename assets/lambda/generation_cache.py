@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from coalescing import SingleFlight
+from loguru import logger
+from object_store import store_from_url
+
+# bump when the cached output format changes in a way the options don't capture
+CACHE_SCHEMA = 3
+
+
+def _canonical(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def options_digest(options, **extra):
+    """Canonical hash of a cleaned options namespace (or dict) plus extra inputs."""
+    values = dict(options if isinstance(options, dict) else vars(options))
+    values.pop("outfile", None)
+    payload = json.dumps(
+        {"schema": CACHE_SCHEMA, "options": _canonical(values), **_canonical(extra)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(f):
+    """Hash an uploaded file and rewind it so it can still be read afterwards."""
+    if not f:
+        return None
+    h = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(1 << 16), b""):
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def form_digest(form, files, image_fields, **extra):
+    """Hash a box form's plain fields together with its uploaded images."""
+    values = {
+        name: str(field.data)
+        for name, field in form._fields.items()
+        if name not in image_fields
+    }
+    images = {name: file_digest(files.get(name)) for name in image_fields}
+    return options_digest(values, images=images, **extra)
+
+
+class MemoryTier:
+    name = "memory"
+
+    def __init__(self, max_items, max_bytes):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        evicted = 0
+        if len(data) > self.max_bytes:
+            return evicted
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size += len(data)
+            while len(self.entries) > self.max_items or self.size > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+                evicted += 1
+        return evicted
+
+
+class DiskTier:
+    name = "disk"
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as the LRU clock
+        os.utime(path)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return 0
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        return self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bin"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class ObjectStoreTier:
+    name = "object_store"
+
+    def __init__(self, store, prefix="generation-cache"):
+        self.store = store
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.store.get(f"{self.prefix}/{key}")
+
+    def put(self, key, data):
+        self.store.put(f"{self.prefix}/{key}", data)
+        # expiry is left to the bucket lifecycle rules
+        return 0
+
+
+class GenerationCache:
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.stats = Counter()
+        self.in_flight = SingleFlight()
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            try:
+                data = tier.get(key)
+            except Exception:
+                logger.exception(f"generation cache {tier.name} read failed")
+                data = None
+            if data is not None:
+                self.stats[f"{tier.name}_hit"] += 1
+                # promote into the faster tiers we missed on the way down
+                for faster in self.tiers[:i]:
+                    self._put_tier(faster, key, data)
+                self.log(f"hit ({tier.name})", key)
+                return data
+            self.stats[f"{tier.name}_miss"] += 1
+        self.log("miss", key)
+        return None
+
+    def put(self, key, data):
+        for tier in self.tiers:
+            self._put_tier(tier, key, data)
+
+    def _put_tier(self, tier, key, data):
+        try:
+            self.stats[f"{tier.name}_evict"] += tier.put(key, data)
+        except Exception:
+            logger.exception(f"generation cache {tier.name} write failed")
+
+    def get_or_generate(self, key, generate):
+        data = self.get(key)
+        if data is None:
+            # identical concurrent requests share a single generation
+            data = self.in_flight.do(key, lambda: self._generate(key, generate))
+        return data
+
+    def _generate(self, key, generate):
+        data = generate()
+        self.put(key, data)
+        return data
+
+    def log(self, event, key):
+        logger.info(f"generation cache {event} for {key[:12]}: {dict(self.stats)}")
+
+
+def from_env(environ=os.environ):
+    if environ.get("GENERATION_CACHE", "1") == "0":
+        logger.info("generation cache disabled")
+        return GenerationCache([])
+    tiers = [
+        MemoryTier(
+            int(environ.get("GENERATION_CACHE_ITEMS", 32)),
+            int(environ.get("GENERATION_CACHE_MEMORY_MB", 128)) * 2**20,
+        )
+    ]
+    disk_mb = int(environ.get("GENERATION_CACHE_DISK_MB", 256))
+    if disk_mb:
+        tiers.append(
+            DiskTier(
+                environ.get("GENERATION_CACHE_DIR", "/tmp/generation_cache"),
+                disk_mb * 2**20,
+            )
+        )
+    store = store_from_url(environ.get("GENERATION_CACHE_STORE"))
+    if store is not None:
+        tiers.append(ObjectStoreTier(store))
+    return GenerationCache(tiers)
+
+
+# module level so it survives across warm lambda invocations
+generation_cache = from_env()
@@ -0,0 +1,122 @@
+"""Normalize uploaded box images before they are embedded.
+
+Uploads are checked against a pixel budget from their header alone, then
+each is downsampled (keeping its aspect ratio) to what the face it is
+printed on needs at IMAGE_TARGET_DPI. Images are decoded on a small thread
+pool and results are cached by content hash, so repeated previews of the
+same upload skip the work. Images that are already small enough pass
+through untouched.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from generation_cache import MemoryTier
+from loguru import logger
+from PIL import Image
+from timing import phase
+from wtforms.validators import ValidationError
+
+TARGET_DPI = int(os.environ.get("IMAGE_TARGET_DPI", 300))
+MAX_PIXELS = int(os.environ.get("IMAGE_MAX_MEGAPIXELS", 40)) * 10**6
+CM_PER_INCH = 2.54
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image")
+_cache = MemoryTier(
+    max_items=64, max_bytes=int(os.environ.get("IMAGE_CACHE_MB", 64)) * 2**20
+)
+
+
+class PixelBudget:
+    """Form validator rejecting images whose header claims too many pixels."""
+
+    def __init__(self, max_pixels=MAX_PIXELS):
+        self.max_pixels = max_pixels
+
+    def __call__(self, form, field):
+        f = field.data
+        if not f:
+            return
+        try:
+            width, height = image_size(f)
+        except Exception:
+            raise ValidationError("Could not read this image.")
+        if width * height > self.max_pixels:
+            raise ValidationError(
+                f"Image is {width}x{height}, please upload one of at most "
+                f"{self.max_pixels // 10**6} megapixels."
+            )
+
+
+def image_size(f):
+    # Image.open only parses the header, nothing is decoded
+    f.seek(0)
+    try:
+        with Image.open(f) as image:
+            return image.size
+    finally:
+        f.seek(0)
+
+
+def target_size(size, face_cm, dpi=TARGET_DPI):
+    """Smallest size with the image's aspect ratio that covers the face at dpi."""
+    width, height = size
+    needed = [cm / CM_PER_INCH * dpi for cm in face_cm]
+    scale = max(needed[0] / width, needed[1] / height)
+    if scale >= 1:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize(data, face_cm, dpi=TARGET_DPI):
+    with Image.open(BytesIO(data)) as image:
+        if image.width * image.height > MAX_PIXELS:
+            raise ValueError(f"image is {image.width}x{image.height}")
+        size = target_size(image.size, face_cm, dpi)
+        if size == image.size:
+            return data
+        fmt = image.format
+        # jpeg can decode at a fraction of the size, far cheaper than resizing
+        image.draft(image.mode, size)
+        if fmt != "JPEG" and image.mode not in ["RGB", "RGBA", "L", "LA"]:
+            # palette images would be resized nearest-neighbour, and png has no cmyk
+            image = image.convert("RGBA")
+        resized = image.resize(size, Image.LANCZOS)
+    out = BytesIO()
+    if fmt == "JPEG":
+        resized.save(out, "JPEG", quality=90)
+    else:
+        resized.save(out, "PNG", compress_level=1)
+    logger.info(f"downsampled {fmt} image to {size[0]}x{size[1]}")
+    return out.getvalue()
+
+
+def _cached_normalize(data, face_cm, dpi):
+    key = f"{hashlib.sha256(data).hexdigest()}:{face_cm[0]:.2f}x{face_cm[1]:.2f}@{dpi}"
+    result = _cache.get(key)
+    if result is None:
+        result = normalize(data, face_cm, dpi)
+        _cache.put(key, result)
+    return result
+
+
+def normalize_files(files, faces, dpi=TARGET_DPI):
+    """Normalize the uploads in ``files`` for ``faces`` (field -> (w, h) in cm).
+
+    Returns a dict of field -> file-like object for the fields with an upload.
+    """
+    uploads = {}
+    for name in faces:
+        f = files.get(name)
+        if f:
+            f.seek(0)
+            uploads[name] = f.read()
+            f.seek(0)
+    with phase("images"):
+        futures = {
+            name: _executor.submit(_cached_normalize, data, faces[name], dpi)
+            for name, data in uploads.items()
+        }
+        return {name: BytesIO(future.result()) for name, future in futures.items()}
@@ -0,0 +1,134 @@
+import datetime as dt
+import json
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+import generation
+from loguru import logger
+from object_store import store_from_url
+
+JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+RESULT_TYPES = {".pdf": "application/pdf", ".zip": "application/zip"}
+
+
+class JobStore:
+    """Job state and artifacts, kept in an object store so any container can poll."""
+
+    def __init__(self, store, prefix="jobs"):
+        self.store = store
+        self.prefix = prefix
+
+    def _key(self, job_id, name):
+        return f"{self.prefix}/{job_id}/{name}"
+
+    def create(self, submission):
+        job_id = uuid.uuid4().hex
+        self.store.put(
+            self._key(job_id, "submission.json"),
+            json.dumps(submission).encode("utf-8"),
+            "application/json",
+        )
+        self.set_status(job_id, "queued", tag=submission["tag"])
+        return job_id
+
+    def submission(self, job_id):
+        return json.loads(self.store.get(self._key(job_id, "submission.json")))
+
+    def status(self, job_id):
+        if not JOB_ID.match(job_id):
+            return None
+        data = self.store.get(self._key(job_id, "status.json"))
+        return json.loads(data) if data is not None else None
+
+    def set_status(self, job_id, state, **extra):
+        status = {
+            "id": job_id,
+            "state": state,
+            "updated": dt.datetime.now(dt.timezone.utc).isoformat(),
+            **extra,
+        }
+        self.store.put(
+            self._key(job_id, "status.json"),
+            json.dumps(status).encode("utf-8"),
+            "application/json",
+        )
+        return status
+
+    def put_result(self, job_id, data, suffix=".pdf"):
+        self.store.put(self._key(job_id, f"result{suffix}"), data, RESULT_TYPES[suffix])
+
+    def result(self, job_id, suffix=".pdf"):
+        return self.store.get(self._key(job_id, f"result{suffix}"))
+
+
+def run_job(job_store, job_id, generate=generation.generate):
+    status = job_store.status(job_id)
+    if status is None:
+        logger.error(f"can't run unknown job {job_id}")
+        return
+    tag = status["tag"]
+    job_store.set_status(job_id, "running", tag=tag)
+    logger.info(f"running job {job_id}")
+    try:
+        submission = job_store.submission(job_id)
+        if "batch" in submission:
+            data = batch.generate_zip(submission, generate)
+            download_name = batch.zip_filename(submission["batch"]["field"])
+        else:
+            data = generate(submission).getvalue()
+            download_name = generation.DOWNLOAD_NAMES[tag]
+        job_store.put_result(job_id, data, os.path.splitext(download_name)[1])
+    except Exception as e:
+        logger.exception(f"job {job_id} failed")
+        job_store.set_status(job_id, "failed", tag=tag, error=str(e))
+        return
+    job_store.set_status(
+        job_id, "done", tag=tag, size=len(data), download_name=download_name
+    )
+    logger.info(f"job {job_id} done")
+
+
+class ThreadJobRunner:
+    """Runs jobs on background threads of this process (local and self-hosted use)."""
+
+    def __init__(self, job_store, workers=2, generate=generation.generate):
+        self.job_store = job_store
+        self.generate = generate
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+
+    def submit(self, job_id):
+        self.executor.submit(run_job, self.job_store, job_id, self.generate)
+
+
+class LambdaJobRunner:
+    """Hands jobs to a worker lambda; the API lambda is frozen once it has responded."""
+
+    def __init__(self, function_name, client=None):
+        if client is None:
+            import boto3
+
+            client = boto3.client("lambda")
+        self.client = client
+        self.function_name = function_name
+
+    def submit(self, job_id):
+        self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps({"job_id": job_id}).encode("utf-8"),
+        )
+
+
+def from_env(environ=os.environ):
+    job_store = JobStore(store_from_url(environ.get("JOB_STORE", "/tmp/jobs")))
+    function_name = environ.get("JOB_WORKER_FUNCTION")
+    if function_name:
+        runner = LambdaJobRunner(function_name)
+    else:
+        runner = ThreadJobRunner(job_store, int(environ.get("JOB_WORKERS", 2)))
+    return job_store, runner
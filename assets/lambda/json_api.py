@@ -0,0 +1,110 @@
+"""Versioned JSON API for divider generation, for programmatic clients.
+
+A request is a JSON object of DomDivForm field names, any of them left out
+taking the value the form page submits by default. The schema (field types,
+choices and those defaults) is derived from the form once per process, so a
+request is validated in one pass over its fields and turned into options by
+``domdiv_form.build_options``, the mapping the form uses, without WTForms
+or argparse. Bump API_VERSION when a field changes incompatibly.
+"""
+
+from domdiv_form import DomDivForm, build_options
+
+API_VERSION = 1
+# JSON type of each WTForms field type the dividers form uses
+FIELD_TYPES = {
+    "BooleanField": "boolean",
+    "FloatField": "number",
+    "SelectField": "string",
+    "RadioField": "string",
+    "SelectMultipleField": "array",
+}
+
+_schema = None
+
+
+def compile_schema():
+    """Field types, choices and defaults of the dividers form."""
+    import generation
+    from prebuilt import page_formdata
+
+    fields = {}
+    with generation.standalone_app().test_request_context():
+        # the values of the default submission, as populate_obj hands them over
+        form = DomDivForm(formdata=page_formdata(DomDivForm(formdata=None)))
+        for field in form:
+            spec = {"type": FIELD_TYPES[field.type], "default": field.data}
+            if spec["type"] in ["string", "array"]:
+                spec["choices"] = [str(value) for value, _ in field.choices]
+            fields[field.name] = spec
+    return fields
+
+
+def schema():
+    global _schema
+    if _schema is None:
+        _schema = compile_schema()
+        for spec in _schema.values():
+            if "choices" in spec:
+                spec["allowed"] = frozenset(spec["choices"])
+    return _schema
+
+
+def public_schema():
+    return {
+        "version": API_VERSION,
+        "fields": {
+            name: {k: v for k, v in spec.items() if k != "allowed"}
+            for name, spec in schema().items()
+        },
+    }
+
+
+def check_value(spec, value):
+    """``value`` as the form would have it, and an error message if it's invalid."""
+    kind = spec["type"]
+    if kind == "boolean":
+        if not isinstance(value, bool):
+            return None, "Not a boolean."
+        return value, None
+    if kind == "number":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None, "Not a number."
+        return float(value), None
+    if kind == "string":
+        values = [value]
+    elif isinstance(value, list):
+        values = value
+    else:
+        return None, "Not a list."
+    checked = []
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, (str, int)):
+            return None, f"Not a valid choice: {v!r}."
+        if str(v) not in spec["allowed"]:
+            return None, f"Not a valid choice: {v}."
+        checked.append(str(v))
+    return (checked[0] if kind == "string" else checked), None
+
+
+def validate(body):
+    """Field values for a request body, and errors by field name."""
+    if not isinstance(body, dict):
+        return None, {"": ["Expected a JSON object."]}
+    fields = schema()
+    # in form field order, which build_options relies on
+    values = {name: spec["default"] for name, spec in fields.items()}
+    errors = {}
+    for name, value in body.items():
+        spec = fields.get(name)
+        if spec is None:
+            errors[name] = ["Unknown field."]
+            continue
+        values[name], error = check_value(spec, value)
+        if error:
+            errors[name] = [error]
+    return values, errors
+
+
+def options(values, font_dir=None):
+    return build_options(values, DomDivForm.expansion_choices, font_dir)
@@ -1,5 +1,6 @@
 import base64
 import json
+from io import BytesIO
 import os
 import sys
 
@@ -8,7 +9,8 @@ import apig_wsgi
 import domdiv
 import domdiv.main
 import domdiv.db
-from flask import Flask, request, send_file, url_for, jsonify, abort
+from flask import Flask, request, send_file, url_for, jsonify, abort, redirect
+from flask import stream_with_context
 from flask import render_template
 from flask_bootstrap import Bootstrap4
 from flask_uploads import IMAGES
@@ -16,6 +18,18 @@ from flask_uploads import IMAGES
 from domdiv_form import DomDivForm
 from tuckbox_form import TuckboxForm
 from chitbox_form import ChitboxForm
+from coalescing import preview_versions
+from preview_render import RASTER_FORMATS, rasterize_first_page
+import timing
+import batch
+import generation
+import jobs
+import json_api
+import offload
+import page_cache
+import prebuilt
+import uploads
+import warmup
 
 PAGES = {
     "dominion_dividers": "Dominion Dividers",
@@ -32,11 +46,43 @@ flask_app.config["SECRET_KEY"] = secret_key
 flask_app.config["UPLOADS_DEFAULT_DEST"] = "/tmp"
 flask_app.config["UPLOADED_FILES_ALLOW"] = IMAGES
 flask_app.config["WTF_CSRF_ENABLED"] = False
+flask_app.config["MAX_CONTENT_LENGTH"] = uploads.MAX_CONTENT_LENGTH
+flask_app.request_class = uploads.BoundedRequest
+flask_app.teardown_request(uploads.cleanup_scratch_dir)
+uploads.sweep()
 
 logger.remove()
 logger.add(sys.stderr, level=os.environ.get("LOG_LEVEL", "INFO"))
 
-apig_wsgi_handler = apig_wsgi.make_lambda_handler(flask_app, binary_support=True)
+apig_wsgi_app = apig_wsgi.make_lambda_handler(flask_app, binary_support=True)
+
+
+if os.environ.get("WARMUP") == "1":
+    warmup.warm()
+
+
+def apig_wsgi_handler(event, context):
+    if warmup.is_keep_warm(event):
+        # scheduled ping, keeping the container around is all it's for
+        return {"warm": True}
+    # refuse oversized bodies before apig_wsgi decodes them into memory
+    if uploads.event_too_large(event):
+        return uploads.too_large_response()
+    return apig_wsgi_app(event, context)
+
+
+job_store, job_runner = jobs.from_env()
+
+# set by server.py to run generation in a pool of pre-warmed worker processes
+generation_pool = None
+# apig_wsgi buffers a whole response, so on lambda batches run as jobs instead
+STREAM_BATCHES = os.environ.get("STREAM_BATCHES", "1") == "1"
+
+
+def job_handler(event, context):
+    # entry point of the worker lambda that runs background jobs
+    jobs.run_job(job_store, event["job_id"])
+
 
 if os.environ.get("DEBUG"):
     apig_wsgi_handler_helper = apig_wsgi_handler
@@ -49,39 +95,51 @@ if os.environ.get("DEBUG"):
         return response
 
 
-def get_pages():
-    return {url_for(p): n for p, n in PAGES.items()}
+@flask_app.before_request
+def start_request_timer():
+    timing.start(request.endpoint)
+    with timing.phase("parse"):
+        # parse the body up front so its cost isn't attributed to the form
+        request.form
+        request.files
 
 
-@flask_app.route("/", methods=["GET", "POST"])
-def dominion_dividers():
-    logger.info(f"root call, request is {request}, form is {request.form}")
-    # logger.info(f"session: {session} {session.get('csrf_token')}")
-    logger.info(f"env is: {os.environ}")
-    form = DomDivForm(font_dir=os.environ.get("FONT_DIR"))
-    logger.info(f"{form} - validate: {form.validate_on_submit()}")
-    logger.info(f"submitted: {form.is_submitted()}")
-    logger.info(f"validates: {form.validate()}")
-    logger.info(f"errors: {form.errors}")
+@flask_app.after_request
+def add_server_timing(response):
+    timer = timing.finish()
+    if timer is not None:
+        response.headers["Server-Timing"] = timer.server_timing()
+        timer.emit(response.status_code)
+    return response
+
+
+def generate_pdf(tag, form, files=None, overrides=None, **kwargs):
+    """Generate the form's PDF in process, or in the worker pool if there is one.
+
+    ``overrides`` maps field names to data replacing what was submitted.
+    """
+    overrides = overrides or {}
+    if generation_pool is None:
+        for name, data in overrides.items():
+            form[name].data = data
+        return form.generate(files=files, **kwargs)
+    submission = generation.capture(tag, request.form, files or {})
+    for name, data in overrides.items():
+        submission["form"][name] = data if isinstance(data, list) else [data]
+    with timing.phase("generate"):
+        return generation_pool.generate(submission, **kwargs)
+
+
+def get_pages():
+    return {url_for(p): n for p, n in PAGES.items()}
 
-    logger.info(f"domdiv version: {domdiv.__version__}")
-    logger.info(f"expansion choices: {domdiv.db.get_expansions()}")
-    if form.validate_on_submit():
-        buf = form.generate()
-        r = send_file(
-            buf,
-            mimetype="application/pdf",
-            as_attachment=True,
-            download_name="sumpfork_dominion_dividers.pdf",
-        )
-        logger.info(f"response: {r}")
-        return r
 
+def dominion_dividers_page(form):
     # setting the default doesn't seem to work, so override here
     form.expansions.data = ["dominion2ndEdition"]
     form.process()
 
-    r = render_template(
+    return render_template(
         "index.html",
         pages=PAGES,
         form=form,
@@ -90,16 +148,75 @@ def dominion_dividers():
         version=domdiv.__version__,
         version_url=f"https://github.com/sumpfork/dominiontabs/releases/tag/v{domdiv.__version__}",
         form_target=url_for("dominion_dividers"),
+        preview_format=os.environ.get("PREVIEW_FORMAT", "pdf"),
         ga_config=os.environ.get("GA_CONFIG", ""),
     )
-    return r
+
+
+def tuckboxes_page(form):
+    return render_template(
+        "index.html",
+        pages=PAGES,
+        form=form,
+        active="tuckboxes",
+        static_url=os.environ["STATIC_WEB_URL"],
+        form_target=url_for("tuckboxes"),
+        preview_format=os.environ.get("PREVIEW_FORMAT", "pdf"),
+    )
+
+
+def chitboxes_page(form):
+    return render_template(
+        "index.html",
+        pages=PAGES,
+        form=form,
+        active="chitboxes",
+        static_url=os.environ["STATIC_WEB_URL"],
+        form_target=url_for("chitboxes"),
+        preview_format=os.environ.get("PREVIEW_FORMAT", "pdf"),
+    )
+
+
+@flask_app.route("/", methods=["GET", "POST"])
+def dominion_dividers():
+    if request.method in ["GET", "HEAD"]:
+        return page_cache.page_response(
+            "dominion_dividers",
+            lambda: dominion_dividers_page(
+                DomDivForm(font_dir=os.environ.get("FONT_DIR"))
+            ),
+        )
+    logger.info(f"root call, request is {request}, form is {request.form}")
+    with timing.phase("form"):
+        form = DomDivForm(font_dir=os.environ.get("FONT_DIR"))
+        valid = form.validate_on_submit()
+        logger.info(f"{form} - validate: {valid}")
+        logger.info(f"errors: {form.errors}")
+
+    logger.info(f"domdiv version: {domdiv.__version__}")
+    if valid:
+        path = prebuilt.prebuilt_path(form)
+        if path:
+            logger.info(f"redirecting to prebuilt {path}")
+            return redirect(f"{os.environ['STATIC_WEB_URL']}/{path}", code=303)
+        buf = generate_pdf("dominion_dividers", form, request.files)
+        with timing.phase("send_file"):
+            r = offload.send_pdf(buf, "sumpfork_dominion_dividers.pdf")
+        logger.info(f"response: {r}")
+        return r
+    return dominion_dividers_page(form)
 
 
 @flask_app.route("/tuckboxes/", methods=["GET", "POST"])
 def tuckboxes():
-    form = TuckboxForm()
-    logger.info(f"in tuckboxes, form validates: {form.validate_on_submit()}")
-    logger.info(f"errors: {form.errors}")
+    if request.method in ["GET", "HEAD"]:
+        return page_cache.page_response(
+            "tuckboxes", lambda: tuckboxes_page(TuckboxForm())
+        )
+    with timing.phase("form"):
+        form = TuckboxForm()
+        logger.info(f"in tuckboxes, form validates: {form.validate_on_submit()}")
+        logger.info(f"errors: {form.errors}")
 
     logger.info(f"file: {form.front_image} {type(form.front_image)}")
     logger.info(f"file data: {form.front_image.data} {type(form.front_image.data)}")
@@ -107,75 +224,234 @@ def tuckboxes():
         logger.info(f"file data: {form.front_image.data.filename}")
     if form.validate_on_submit():
         logger.info(f"tuckbox files: {request.files}")
-        buf = form.generate(files=request.files)
-        r = send_file(
-            buf,
-            mimetype="application/pdf",
-            as_attachment=True,
-            download_name="sumpfork_tuckbox.pdf",
-        )
+        buf = generate_pdf("tuckboxes", form, request.files)
+        with timing.phase("send_file"):
+            r = offload.send_pdf(buf, "sumpfork_tuckbox.pdf")
         logger.info(f"response: {r}")
         return r
-    r = render_template(
-        "index.html",
-        pages=PAGES,
-        form=form,
-        active="tuckboxes",
-        static_url=os.environ["STATIC_WEB_URL"],
-        form_target=url_for("tuckboxes"),
-    )
-    return r
+    return tuckboxes_page(form)
 
 
 @flask_app.route("/chitboxes/", methods=["GET", "POST"])
 def chitboxes():
-    form = ChitboxForm()
-    logger.info(f"in chitboxes, form validates: {form.validate_on_submit()}")
-    logger.info(f"errors: {form.errors}")
+    if request.method in ["GET", "HEAD"]:
+        return page_cache.page_response(
+            "chitboxes", lambda: chitboxes_page(ChitboxForm())
+        )
+    with timing.phase("form"):
+        form = ChitboxForm()
+        logger.info(f"in chitboxes, form validates: {form.validate_on_submit()}")
+        logger.info(f"errors: {form.errors}")
     if form.validate_on_submit():
         logger.info(f"chitbox files: {request.files}")
-        buf = form.generate(files=request.files)
-        r = send_file(
-            buf,
-            mimetype="application/pdf",
-            as_attachment=True,
-            download_name="sumpfork_chitbox.pdf",
-        )
+        buf = generate_pdf("chitboxes", form, request.files)
+        with timing.phase("send_file"):
+            r = offload.send_pdf(buf, "sumpfork_chitbox.pdf")
         logger.info(f"response: {r}")
         return r
-    r = render_template(
-        "index.html",
-        pages=PAGES,
-        form=form,
-        active="chitboxes",
-        static_url=os.environ["STATIC_WEB_URL"],
-        form_target=url_for("chitboxes"),
+    return chitboxes_page(form)
+
+
+@flask_app.route("/batch/dominion_dividers/", methods=["POST"])
+def dominion_dividers_batch():
+    with timing.phase("form"):
+        form = DomDivForm(font_dir=os.environ.get("FONT_DIR"))
+        valid = form.validate()
+    if not valid:
+        return jsonify({"error": "Invalid Form Entries", "errors": form.errors}), 400
+    field = request.form.get("batch_by", "expansions")
+    try:
+        values = batch.variant_values(form, field, request.form.getlist("batch_values"))
+    except batch.InvalidBatch as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"batch of {len(values)} dividers by {field}")
+    if not STREAM_BATCHES:
+        # a batch of full size PDFs outgrows the 6 MB lambda response and the
+        # API timeout, so it is generated by the job worker and downloaded
+        # from the job store
+        submission = generation.capture(
+            "dominion_dividers", request.form, request.files
+        )
+        submission["batch"] = {"field": field, "values": values}
+        return queue_job(submission)
+
+    def pdf(value):
+        # one form for all variants, fonts and card data stay loaded in between
+        buf = generate_pdf(
+            "dominion_dividers",
+            form,
+            request.files,
+            overrides={field: batch.variant_data(field, value)},
+        )
+        return batch.variant_filename(value), buf.getvalue()
+
+    # generated before responding, so a batch that can't be made gets an error
+    first = pdf(values[0])
+
+    def pdfs():
+        yield first
+        for value in values[1:]:
+            try:
+                yield pdf(value)
+            except Exception:
+                # too late for an error status; breaking off the stream leaves
+                # the archive without its central directory, so it won't open
+                logger.exception(f"batch variant {value} failed, aborting the zip")
+                raise
+
+    return flask_app.response_class(
+        stream_with_context(batch.zip_stream(pdfs())),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={batch.zip_filename(field)}"
+        },
     )
-    return r
+
+
+def superseded_preview(client, seq):
+    logger.info(f"dropping superseded preview {seq} for client {client}")
+    return jsonify({"error": "Superseded by a newer preview"}), 409
 
 
 @flask_app.route("/preview/<string:tag>/", methods=["POST"])
 def preview(tag):
     logger.info(f"preview call for {tag}, request is {request}, form is {request.form}")
-    if tag == "dominion_dividers":
-        form = DomDivForm(request.form, font_dir=os.environ.get("FONT_DIR"))
-    elif tag == "chitboxes":
-        form = ChitboxForm(request.form)
-    elif tag == "tuckboxes":
-        form = TuckboxForm(request.form)
-    else:
-        abort(404)
-    logger.info(f"submitted: {form.is_submitted()}")
-    logger.info(f"validates: {form.validate()}")
-    logger.info(f"errors: {form.errors}")
-    if form.validate():
-        buf = form.generate(num_pages=1, files=request.files)
-        buf = base64.b64encode(buf.getvalue()).decode("ascii")
-        r = jsonify({"preview_pdf": buf})
-        logger.info(f"reponse: {r}")
-        return r
+    preview_format = request.args.get("format", "pdf")
+    if preview_format not in ["pdf", "json"] and preview_format not in RASTER_FORMATS:
+        abort(400)
+    client = request.headers.get("X-Preview-Client")
+    seq = request.headers.get("X-Preview-Seq", type=int)
+    if client and seq is not None and not preview_versions.observe(client, seq):
+        return superseded_preview(client, seq)
+    with timing.phase("form"):
+        if tag == "dominion_dividers":
+            form = DomDivForm(request.form, font_dir=os.environ.get("FONT_DIR"))
+        elif tag == "chitboxes":
+            form = ChitboxForm()
+        elif tag == "tuckboxes":
+            form = TuckboxForm()
+        else:
+            abort(404)
+        logger.info(f"submitted: {form.is_submitted()}")
+        logger.info(f"validates: {form.validate()}")
+        logger.info(f"errors: {form.errors}")
+        valid = form.validate()
+    if valid:
+        # a newer preview from the same page may have arrived while we validated
+        if client and seq is not None and not preview_versions.is_current(client, seq):
+            return superseded_preview(client, seq)
+        buf = generate_pdf(tag, form, request.files, num_pages=1, preview=True)
+        if preview_format in RASTER_FORMATS:
+            with timing.phase("encode"):
+                image, mimetype = rasterize_first_page(
+                    buf,
+                    preview_format,
+                    request.args.get("dpi", 72, type=int),
+                )
+            with timing.phase("send_file"):
+                return send_file(image, mimetype=mimetype)
+        if preview_format == "json":
+            # base64 in JSON, for clients from before the binary preview
+            with timing.phase("encode"):
+                buf = base64.b64encode(buf.getbuffer()).decode("ascii")
+                r = jsonify({"preview_pdf": buf})
+            logger.info(f"reponse: {r}")
+            return r
+        # streamed straight from the buffer, without copies or base64
+        with timing.phase("send_file"):
+            return send_file(buf, mimetype="application/pdf")
     return jsonify({"error": "Invalid Form Entries"})
 
 
+def job_response(status):
+    if status["state"] == "done":
+        status["result_url"] = url_for("job_result", job_id=status["id"])
+    return jsonify(status)
+
+
+def queue_job(submission):
+    tag = submission["tag"]
+    job_id = job_store.create(submission)
+    try:
+        job_runner.submit(job_id)
+    except Exception as e:
+        # nothing will pick the job up, so don't leave it queued for pollers
+        logger.exception(f"couldn't start {tag} job {job_id}")
+        job_store.set_status(job_id, "failed", tag=tag, error=str(e))
+        return jsonify({"error": "Couldn't start the job, please retry"}), 503
+    logger.info(f"queued {tag} job {job_id}")
+    r = job_response(job_store.status(job_id))
+    return r, 202, {"Location": url_for("job_status", job_id=job_id)}
+
+
+@flask_app.route("/jobs/<string:tag>/", methods=["POST"])
+def submit_job(tag):
+    if tag not in generation.FORMS:
+        abort(404)
+    submission = generation.capture(tag, request.form, request.files)
+    # validate up front so bad input is reported now rather than on the job
+    form, _ = generation.make_form(submission)
+    if not form.validate():
+        return jsonify({"error": "Invalid Form Entries", "errors": form.errors}), 400
+    return queue_job(submission)
+
+
+@flask_app.route("/jobs/<string:job_id>/", methods=["GET"])
+def job_status(job_id):
+    status = job_store.status(job_id)
+    if status is None:
+        abort(404)
+    return job_response(status)
+
+
+@flask_app.route("/jobs/<string:job_id>/result", methods=["GET"])
+def job_result(job_id):
+    status = job_store.status(job_id)
+    if status is None:
+        abort(404)
+    if status["state"] != "done":
+        return jsonify(status), 409
+    # batch jobs name their ZIP; jobs from before that are all PDFs
+    download_name = status.get(
+        "download_name", generation.DOWNLOAD_NAMES[status["tag"]]
+    )
+    suffix = os.path.splitext(download_name)[1]
+    return send_file(
+        BytesIO(job_store.result(job_id, suffix)),
+        mimetype=jobs.RESULT_TYPES[suffix],
+        as_attachment=True,
+        download_name=download_name,
+    )
+
+
+@flask_app.route(
+    f"/api/v{json_api.API_VERSION}/dominion_dividers/", methods=["GET", "POST"]
+)
+def api_dominion_dividers():
+    if request.method in ["GET", "HEAD"]:
+        return jsonify(json_api.public_schema())
+    with timing.phase("form"):
+        values, errors = json_api.validate(request.get_json(silent=True))
+    if errors:
+        return jsonify({"error": "Invalid Form Entries", "errors": errors}), 400
+    with timing.phase("clean_options"):
+        options = json_api.options(values, os.environ.get("FONT_DIR"))
+    buf = DomDivForm.generate_options(options)
+    with timing.phase("send_file"):
+        return offload.send_pdf(buf, "sumpfork_dominion_dividers.pdf")
+
+
+@flask_app.route("/offloaded/<string:token>/", methods=["GET"])
+def offloaded(token):
+    return offload.offloaded_response(token)
+
+
+if os.environ.get("WARMUP") == "1":
+    # render the pages into the page cache too, now that the routes exist
+    with flask_app.test_request_context():
+        for page in PAGES:
+            flask_app.view_functions[page]()
+
+
 if __name__ == "__main__":
     flask_app.run(debug=True)
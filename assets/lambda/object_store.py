@@ -0,0 +1,116 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from loguru import logger
+
+
+class ObjectStore(ABC):
+    """Minimal key/bytes store used for caches and artifacts that outlive a container."""
+
+    @abstractmethod
+    def get(self, key):
+        """The object's bytes, or None if there is no such key."""
+
+    @abstractmethod
+    def put(self, key, data, content_type="application/octet-stream"):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    def presigned_url(self, key, expires_in, download_name=None):
+        """A URL the object can be downloaded from for ``expires_in`` seconds.
+
+        None for stores that can't hand out URLs of their own.
+        """
+        return None
+
+
+class LocalDirectoryStore(ObjectStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        # keys can come from requests, keep them inside the store
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"bad key {key}")
+        return path
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so concurrent readers never see a partial object
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store(ObjectStore):
+    def __init__(self, bucket, prefix="", client=None):
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=data, ContentType=content_type
+        )
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key, expires_in, download_name=None):
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if download_name:
+            params["ResponseContentDisposition"] = (
+                f'attachment; filename="{download_name}"'
+            )
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in
+        )
+
+
+def store_from_url(url):
+    """Build a store from ``s3://bucket/prefix`` or a local directory path."""
+    if not url:
+        return None
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://") :].partition("/")
+        logger.info(f"using s3 object store {bucket}/{prefix}")
+        return S3Store(bucket, prefix)
+    if url.startswith("file://"):
+        url = url[len("file://") :]
+    logger.info(f"using local object store in {url}")
+    return LocalDirectoryStore(url)
@@ -0,0 +1,84 @@
+"""Hand out large PDFs from an object store instead of in the response.
+
+A lambda response can't be much more than 6 MB, a third of which goes to
+base64, so a PDF over OFFLOAD_THRESHOLD_KB is put into OFFLOAD_STORE and
+the submission is answered with a redirect to it. S3 stores redirect to a
+presigned URL valid for OFFLOAD_URL_EXPIRES seconds; a local directory
+store, for development and tests, redirects to the ``offloaded`` route
+with a token signed by the app's secret key that expires just the same.
+Its expired PDFs are swept whenever another one is offloaded; on S3 the
+bucket's lifecycle rules remove them.
+"""
+
+import os
+import shutil
+import time
+import uuid
+from io import BytesIO
+
+from flask import abort, current_app, redirect, send_file, url_for
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from loguru import logger
+from object_store import LocalDirectoryStore, store_from_url
+from timing import phase
+
+OFFLOAD_THRESHOLD = int(os.environ.get("OFFLOAD_THRESHOLD_KB", 4096)) * 2**10
+OFFLOAD_URL_EXPIRES = int(os.environ.get("OFFLOAD_URL_EXPIRES", 300))
+
+store = store_from_url(os.environ.get("OFFLOAD_STORE", "/tmp/offload"))
+
+
+def sweep():
+    """Remove offloaded PDFs from a local store once their links have expired."""
+    if not isinstance(store, LocalDirectoryStore):
+        return
+    cutoff = time.time() - OFFLOAD_URL_EXPIRES
+    # one directory per offloaded PDF
+    for entry in os.scandir(store.root):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            logger.info(f"removing expired offloaded pdf {entry.name}")
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt="offload")
+
+
+def send_pdf(buf, download_name):
+    """Send the PDF in ``buf`` as a download, offloading it if it is too large."""
+    size = buf.getbuffer().nbytes
+    if size <= OFFLOAD_THRESHOLD:
+        return send_file(
+            buf,
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=download_name,
+        )
+    key = f"{uuid.uuid4().hex}/{download_name}"
+    with phase("offload"):
+        sweep()
+        store.put(key, buf.getvalue(), "application/pdf")
+        url = store.presigned_url(key, OFFLOAD_URL_EXPIRES, download_name)
+    if url is None:
+        url = url_for("offloaded", token=_serializer().dumps(key))
+    logger.info(f"offloaded {size} byte pdf to {key}")
+    return redirect(url, code=303)
+
+
+def offloaded_response(token):
+    """The download behind a signed ``token`` from ``send_pdf``."""
+    try:
+        key = _serializer().loads(token, max_age=OFFLOAD_URL_EXPIRES)
+    except SignatureExpired:
+        abort(410)
+    except BadSignature:
+        abort(404)
+    data = store.get(key)
+    if data is None:
+        abort(404)
+    return send_file(
+        BytesIO(data),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=key.rpartition("/")[2],
+    )
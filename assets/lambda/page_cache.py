@@ -0,0 +1,36 @@
+"""Serve the form pages rendered once per process, with cache validators.
+
+A GET of a form page only changes with a deploy (templates, domdiv's
+choices, environment), so each page is rendered on first use and served
+from memory after that. Responses carry a strong ETag and a Cache-Control
+that lets CloudFront keep them for PAGE_SHARED_MAX_AGE seconds (every
+deploy invalidates the distribution) and browsers for PAGE_MAX_AGE, after
+which a conditional request is answered with a 304.
+"""
+
+import hashlib
+import os
+
+from flask import current_app, request
+
+PAGE_MAX_AGE = int(os.environ.get("PAGE_MAX_AGE", 300))
+PAGE_SHARED_MAX_AGE = int(os.environ.get("PAGE_SHARED_MAX_AGE", 86400))
+
+_pages = {}
+
+
+def page_response(name, render):
+    """Response for page ``name``, calling ``render`` for its html the first time."""
+    # links are built against the script root, which differs between entry points
+    key = (name, request.script_root)
+    page = _pages.get(key)
+    if page is None:
+        body = render().encode("utf-8")
+        page = _pages[key] = (body, hashlib.sha256(body).hexdigest())
+    body, etag = page
+    response = current_app.response_class(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    response.cache_control.s_maxage = PAGE_SHARED_MAX_AGE
+    return response.make_conditional(request)
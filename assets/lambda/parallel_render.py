@@ -0,0 +1,113 @@
+"""Draw a computed divider layout on several cores and merge the PDFs.
+
+The layout (``DividerDrawer.pages``) is computed once for the whole set, so
+tab positions, ``expansion_reset_tabs`` and page footers come out the same as
+a serial run. Only drawing is sharded, in contiguous page ranges; every page
+is drawn with its back, so front/back pairs never straddle two shards.
+
+Shards are forked processes returning their PDF over a pipe (Lambda has no
+/dev/shm, which rules out multiprocessing pools and queues there).
+"""
+
+import multiprocessing
+import os
+from io import BytesIO
+
+import pdf_optimize
+import pikepdf
+from loguru import logger
+
+PARALLEL_WORKERS = int(
+    os.environ.get("PARALLEL_GENERATION_WORKERS", os.cpu_count() or 1)
+)
+# pages per shard below which forking costs more than it saves
+MIN_SHARD_PAGES = int(os.environ.get("PARALLEL_GENERATION_MIN_SHARD_PAGES", 4))
+
+
+def page_ranges(num_pages, shards):
+    size, extra = divmod(num_pages, shards)
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        yield start, end
+        start = end
+
+
+def shard_count(num_pages, workers=None):
+    workers = PARALLEL_WORKERS if workers is None else workers
+    return max(1, min(workers, num_pages // MIN_SHARD_PAGES))
+
+
+def draw_shard(dd, cards, start, end, last, conn):
+    try:
+        options = dd.options
+        dd.pages = dd.pages[start:end]
+        options.outfile = BytesIO()
+        options.num_pages = -1
+        if not last:
+            # the info pages belong at the end of the document
+            options.info = options.info_all = False
+        dd.draw(cards)
+        conn.send(("ok", options.outfile.getvalue()))
+    except Exception as e:
+        logger.exception(f"drawing pages {start}-{end} failed")
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+
+def merge(pdfs, outfile):
+    merged = pikepdf.Pdf.new()
+    sources = [pikepdf.Pdf.open(BytesIO(pdf)) for pdf in pdfs]
+    for source in sources:
+        merged.pages.extend(source.pages)
+    # every shard embeds its own copy of shared artwork
+    pdf_optimize.dedupe_streams(merged)
+    merged.save(outfile)
+    for source in sources:
+        source.close()
+
+
+def draw(dd, cards, workers=None):
+    """Draw ``dd`` to ``dd.options.outfile``, in parallel if it is large enough."""
+    if dd.options.num_pages is not None and dd.options.num_pages > 0:
+        dd.pages = dd.pages[: dd.options.num_pages]
+    shards = shard_count(len(dd.pages), workers)
+    if shards == 1:
+        dd.draw(cards)
+        return
+
+    logger.info(f"drawing {len(dd.pages)} pages in {shards} processes")
+    context = multiprocessing.get_context("fork")
+    children = []
+    ranges = list(page_ranges(len(dd.pages), shards))
+    for i, (start, end) in enumerate(ranges):
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(
+            target=draw_shard,
+            args=(dd, cards, start, end, i == len(ranges) - 1, child_conn),
+        )
+        process.start()
+        child_conn.close()
+        children.append((process, parent_conn))
+
+    pdfs = []
+    try:
+        # in order; later shards simply wait to be read
+        for process, conn in children:
+            try:
+                status, payload = conn.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(f"shard process exited with {process.exitcode}")
+            if status != "ok":
+                raise RuntimeError(f"shard failed: {payload}")
+            pdfs.append(payload)
+    finally:
+        for process, conn in children:
+            conn.close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+    merge(pdfs, dd.options.outfile)
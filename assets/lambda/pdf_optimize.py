@@ -0,0 +1,95 @@
+"""Shrink generated PDFs before they are cached and returned.
+
+Reportlab is told not to ASCII85-encode streams, which only makes binary
+PDFs a quarter larger. Beyond that, an optional pass (PDF_OPTIMIZE=1) keeps
+one copy of identical streams (images, embedded font programs) and points
+every reference at it, deflates streams written without a filter and packs
+objects into object streams. Each pass logs the size before and after and
+is timed as the "optimize" phase.
+"""
+
+import hashlib
+import os
+import time
+from io import BytesIO
+
+import pikepdf
+from loguru import logger
+from reportlab import rl_config
+from timing import phase
+
+PDF_OPTIMIZE = os.environ.get("PDF_OPTIMIZE", "0") == "1"
+
+rl_config.useA85 = 0
+
+
+def _digest(stream):
+    # /Length differs with nothing else when a stream is re-serialized
+    header = {k: str(v) for k, v in stream.stream_dict.items() if k != "/Length"}
+    digest = hashlib.sha256(repr(sorted(header.items())).encode("utf-8"))
+    digest.update(stream.read_raw_bytes())
+    return digest.digest()
+
+
+def _redirect(obj, replacements):
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        items = obj.items()
+    elif isinstance(obj, pikepdf.Array):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in list(items):
+        if not isinstance(value, pikepdf.Object):
+            continue
+        if value.is_indirect:
+            if value.objgen in replacements:
+                obj[key] = replacements[value.objgen]
+        else:
+            _redirect(value, replacements)
+
+
+def dedupe_streams(pdf):
+    """Point references to identical streams at one copy; returns how many went.
+
+    Unreferenced copies are dropped when the PDF is saved.
+    """
+    canonical = {}
+    replacements = {}
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream):
+            first = canonical.setdefault(_digest(obj), obj)
+            if first.objgen != obj.objgen:
+                replacements[obj.objgen] = first
+    if replacements:
+        for obj in pdf.objects:
+            _redirect(obj, replacements)
+        for page in pdf.pages:
+            _redirect(page.obj, replacements)
+    return len(replacements)
+
+
+def save(pdf, outfile):
+    pdf.save(
+        outfile,
+        compress_streams=True,
+        object_stream_mode=pikepdf.ObjectStreamMode.generate,
+    )
+
+
+def optimize(data):
+    """Optimized copy of the PDF in ``data`` (bytes)."""
+    start = time.perf_counter()
+    with phase("optimize"), pikepdf.Pdf.open(BytesIO(data)) as pdf:
+        removed = dedupe_streams(pdf)
+        out = BytesIO()
+        save(pdf, out)
+    optimized = out.getvalue()
+    logger.info(
+        f"optimized pdf from {len(data)} to {len(optimized)} bytes "
+        f"({removed} duplicate streams) in {time.perf_counter() - start:.2f}s"
+    )
+    return optimized
+
+
+def maybe_optimize(data):
+    return optimize(data) if PDF_OPTIMIZE else data
@@ -0,0 +1,145 @@
+"""Divider PDFs for popular configurations, generated ahead of time.
+
+popular_configs.json lists form settings, each expanded over every value
+(``"*"``) or the listed values of the fields in ``each``. At deploy time
+``python prebuilt.py generate OUTDIR`` renders them through DomDivForm into
+OUTDIR, which app.py uploads to the static site under PREBUILT_PREFIX. The
+image build runs ``python prebuilt.py manifest`` to record which option
+hashes have a copy there, and submissions matching one are redirected to
+it instead of being generated. Both only depend on the config file and
+domdiv's version, so either can be rerun offline.
+"""
+
+import itertools
+import json
+import os
+import sys
+
+import domdiv
+from generation_cache import options_digest
+from loguru import logger
+from werkzeug.datastructures import MultiDict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get(
+    "POPULAR_CONFIGS", os.path.join(HERE, "popular_configs.json")
+)
+MANIFEST_PATH = os.path.join(HERE, "prebuilt_manifest.json")
+PREBUILT_PREFIX = "prebuilt"
+# options that differ between environments without changing the output
+ENVIRONMENT_OPTIONS = ["font_dir", "outfile"]
+
+
+def config_key(options):
+    values = {k: v for k, v in vars(options).items() if k not in ENVIRONMENT_OPTIONS}
+    return options_digest(values, domdiv_version=domdiv.__version__)
+
+
+def asset_path(key):
+    return f"{PREBUILT_PREFIX}/{key}.pdf"
+
+
+def page_formdata(form):
+    """What a browser submits for ``form`` as the page renders it."""
+    formdata = MultiDict()
+    for field in form:
+        if field.type == "BooleanField":
+            if field.data:
+                formdata.add(field.name, "y")
+        elif field.type == "FileField":
+            # sent as files, not as form fields
+            continue
+        elif field.type == "SelectMultipleField":
+            for value in field.data or []:
+                formdata.add(field.name, str(value))
+        elif field.type in ["SelectField", "RadioField"]:
+            formdata.add(field.name, str(field.data))
+        else:
+            formdata.add(field.name, field._value())
+    return formdata
+
+
+def popular_forms(path=CONFIG_PATH):
+    """Yield a validated DomDivForm per configuration; needs a request context."""
+    from domdiv_form import DomDivForm
+
+    with open(path) as f:
+        configs = json.load(f)["configs"]
+    blank = DomDivForm(formdata=None)
+    defaults = page_formdata(blank)
+    for config in configs:
+        fields = list(config.get("each", {}))
+        values = [
+            [value for value, _ in blank[field].choices]
+            if config["each"][field] == "*"
+            else config["each"][field]
+            for field in fields
+        ]
+        for combination in itertools.product(*values):
+            data = dict(config.get("form", {}), **dict(zip(fields, combination)))
+            formdata = defaults.copy()
+            for field, value in data.items():
+                formdata.setlist(field, value if isinstance(value, list) else [value])
+            form = DomDivForm(formdata=formdata, font_dir=os.environ.get("FONT_DIR"))
+            if not form.validate():
+                raise ValueError(f"invalid popular configuration {data}: {form.errors}")
+            yield form
+
+
+def write_manifest(path=MANIFEST_PATH):
+    import generation
+
+    with generation.standalone_app().test_request_context():
+        keys = [config_key(form.clean_options()) for form in popular_forms()]
+    manifest = {
+        "domdiv_version": domdiv.__version__,
+        "files": {key: asset_path(key) for key in keys},
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    logger.info(f"wrote manifest of {len(keys)} prebuilt PDFs to {path}")
+
+
+def generate(outdir):
+    import generation
+
+    os.makedirs(outdir, exist_ok=True)
+    with generation.standalone_app().test_request_context():
+        for form in popular_forms():
+            key = config_key(form.clean_options())
+            path = os.path.join(outdir, f"{key}.pdf")
+            if os.path.exists(path):
+                continue
+            with open(path, "wb") as f:
+                f.write(form.generate().getvalue())
+            logger.info(f"generated {path}")
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get("domdiv_version") != domdiv.__version__:
+        logger.warning(
+            f"prebuilt manifest is for domdiv {manifest.get('domdiv_version')}, "
+            f"have {domdiv.__version__}; ignoring it"
+        )
+        return {}
+    return manifest["files"]
+
+
+_files = load_manifest()
+
+
+def prebuilt_path(form):
+    """Path on the static site of a prebuilt copy of the form's PDF, if any."""
+    if not _files:
+        return None
+    return _files.get(config_key(form.clean_options()))
+
+
+if __name__ == "__main__":
+    commands = {"manifest": write_manifest, "generate": generate}
+    commands[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,27 @@
+from io import BytesIO
+
+import pypdfium2 as pdfium
+
+# format name -> (PIL format, mimetype, save options)
+RASTER_FORMATS = {
+    "png": ("PNG", "image/png", {"compress_level": 6}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+MIN_DPI = 24
+MAX_DPI = 150
+
+
+def rasterize_first_page(pdf, fmt="png", dpi=72):
+    pil_format, mimetype, save_options = RASTER_FORMATS[fmt]
+    dpi = max(MIN_DPI, min(dpi, MAX_DPI))
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        page = doc[0]
+        image = page.render(scale=dpi / 72).to_pil()
+        page.close()
+    finally:
+        doc.close()
+    buf = BytesIO()
+    image.save(buf, pil_format, **save_options)
+    buf.seek(0)
+    return buf, mimetype
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Self-hosted server: a threaded HTTP front end that hands generation to a
+pool of pre-warmed worker processes, so one machine can use all its cores.
+
+    FLASK_SECRET_KEY=... STATIC_WEB_URL=... python server.py --workers 8
+"""
+
+import argparse
+import importlib
+import os
+import signal
+
+import jobs
+from flask import jsonify
+from loguru import logger
+from werkzeug.serving import make_server
+from worker_pool import JobTimeout, PoolFull, WorkerCrashed, WorkerPool
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default=os.environ.get("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=env_int("SERVER_PORT", 8000))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=env_int("SERVER_WORKERS", os.cpu_count()),
+        help="generator processes",
+    )
+    parser.add_argument(
+        "--job-timeout",
+        type=float,
+        default=env_int("SERVER_JOB_TIMEOUT", 120),
+        help="seconds before a generation is killed",
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=env_int("SERVER_MAX_JOBS", 200),
+        help="recycle a worker after this many generations (0 to disable)",
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=int,
+        default=env_int("SERVER_MAX_RSS_MB", 1024),
+        help="recycle a worker once its peak RSS reaches this (0 to disable)",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=env_int("SERVER_MAX_QUEUE", 16),
+        help="generations allowed to wait for a worker before answering 503",
+    )
+    return parser.parse_args()
+
+
+def install_pool(handlers, pool):
+    handlers.generation_pool = pool
+    handlers.job_runner = jobs.ThreadJobRunner(
+        handlers.job_store, env_int("JOB_WORKERS", 2), generate=pool.generate
+    )
+    app = handlers.flask_app
+
+    @app.errorhandler(PoolFull)
+    def pool_full(e):
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": 5}
+
+    @app.errorhandler(JobTimeout)
+    def job_timeout(e):
+        return jsonify({"error": str(e)}), 504
+
+    @app.errorhandler(WorkerCrashed)
+    def worker_crashed(e):
+        return jsonify({"error": "Generation failed"}), 500
+
+
+def main():
+    args = parse_args()
+    # split large generations only over cores the pool leaves idle
+    os.environ.setdefault(
+        "PARALLEL_GENERATION_WORKERS", str(max(1, os.cpu_count() // args.workers))
+    )
+    pool = WorkerPool(
+        workers=args.workers,
+        job_timeout=args.job_timeout,
+        max_jobs=args.max_jobs,
+        max_rss_mb=args.max_rss_mb,
+        max_queue=args.max_queue,
+    )
+    handlers = importlib.import_module("lambda-handlers")
+    install_pool(handlers, pool)
+
+    server = make_server(args.host, args.port, handlers.flask_app, threaded=True)
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+    logger.info(f"serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
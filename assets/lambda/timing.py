@@ -0,0 +1,103 @@
+import contextlib
+import contextvars
+import json
+import os
+import resource
+import time
+
+from loguru import logger
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE")
+
+_current = contextvars.ContextVar("request_timer", default=None)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RequestTimer:
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.durations = {}
+        self.peak_rss_before = peak_rss_mb()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.durations[name] = self.durations.get(name, 0) + elapsed
+
+    def finish(self):
+        self.total = (time.perf_counter() - self.start) * 1000
+        self.peak_rss = peak_rss_mb()
+        # the process high-water mark only moves if this request pushed it up
+        self.peak_rss_growth = self.peak_rss - self.peak_rss_before
+
+    def server_timing(self):
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.durations.items()]
+        entries.append(f"total;dur={self.total:.1f}")
+        entries.append(f'peak-rss;desc="{self.peak_rss:.0f} MB"')
+        return ", ".join(entries)
+
+    def metrics(self, status):
+        # only phases that ran, so a GET doesn't drag down generate percentiles
+        metrics = dict(self.durations, total=self.total)
+        units = {name: "Milliseconds" for name in metrics}
+        metrics["PeakRss"] = self.peak_rss
+        metrics["PeakRssGrowth"] = self.peak_rss_growth
+        units.update(PeakRss="Megabytes", PeakRssGrowth="Megabytes")
+        return {
+            # CloudWatch embedded metric format
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["Route"], []],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit} for name, unit in units.items()
+                        ],
+                    }
+                ],
+            },
+            "Route": self.route or "unknown",
+            "Status": status,
+            **metrics,
+        }
+
+    def emit(self, status):
+        logger.info(f"request timing for {self.route}: {self.server_timing()}")
+        if METRICS_NAMESPACE:
+            # EMF lines must be bare JSON on their own line, so bypass loguru
+            print(json.dumps(self.metrics(status)), flush=True)
+
+
+def start(route):
+    timer = RequestTimer(route)
+    _current.set(timer)
+    return timer
+
+
+def finish():
+    timer = _current.get()
+    _current.set(None)
+    if timer is not None:
+        timer.finish()
+    return timer
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time a block against the current request, if there is one."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.phase(name):
+        yield
@@ -1,5 +1,6 @@
 from io import BytesIO
 import re
+from importlib.metadata import version
 
 from loguru import logger
 import wtforms.fields as wtf_fields
@@ -9,6 +10,14 @@ from flask_wtf.file import FileField as FlaskFileField, FileAllowed
 from flask_uploads import IMAGES
 from tuckboxes.tuckboxes import TuckBoxGenerator
 
+from generation_cache import form_digest, generation_cache
+from image_pipeline import PixelBudget, normalize_files
+import pdf_optimize
+from timing import phase
+
+TUCKBOXES_VERSION = version("tuckboxes")
+IMAGE_FIELDS = ["front_image", "side_image", "back_image", "end_image"]
+
 
 class TuckboxForm(FlaskForm):
     width = wtf_fields.DecimalField(
@@ -27,16 +36,20 @@ class TuckboxForm(FlaskForm):
         default=3,
     )
     front_image = FlaskFileField(
-        label="Upload Main Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload Main Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
     side_image = FlaskFileField(
-        label="Upload Side Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload Side Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
     back_image = FlaskFileField(
-        label="Upload Back Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload Back Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
     end_image = FlaskFileField(
-        label="Upload End Image", validators=[FileAllowed(IMAGES, "Images only!")]
+        label="Upload End Image",
+        validators=[FileAllowed(IMAGES, "Images only!"), PixelBudget()],
     )
     preserve_side_aspect = wtf_fields.BooleanField(
         label="Preserve Side Image Aspect", default=True
@@ -49,26 +62,53 @@ class TuckboxForm(FlaskForm):
     def generate(self, files=None, **kwargs):
         if files is None:
             files = {}
+        key = form_digest(
+            self,
+            files,
+            IMAGE_FIELDS,
+            kind="tuckbox",
+            optimize=pdf_optimize.PDF_OPTIMIZE,
+            generator_version=TUCKBOXES_VERSION,
+        )
+        pdf = generation_cache.get_or_generate(
+            key, lambda: pdf_optimize.maybe_optimize(self.render(files))
+        )
+        return BytesIO(pdf)
+
+    def render(self, files):
         buf = BytesIO()
         logger.info(
             f"fill colour: {self['fill_colour'].data}, {type(self['fill_colour'].data)}"
         )
         fc = re.match(r"#(\w{2})(\w{2})(\w{2})", self["fill_colour"].data).groups()
         fc = tuple(int(p, 16) / 255.0 for p in fc)
+        width = float(self["width"].data)
+        height = float(self["height"].data)
+        depth = float(self["depth"].data)
+        # image axes of each face in cm, as the generator draws them
+        images = normalize_files(
+            files,
+            {
+                "front_image": (height, width),
+                "back_image": (height, width),
+                "side_image": (max(width, height), depth),
+                "end_image": (height, depth),
+            },
+        )
         c = TuckBoxGenerator.fromRawData(
-            float(self["width"].data),
-            float(self["height"].data),
-            float(self["depth"].data),
+            width,
+            height,
+            depth,
             buf,
-            fIm=files.get("front_image"),
-            sIm=files.get("side_image"),
-            bIm=files.get("back_image"),
-            eIm=files.get("end_images"),
+            fIm=images.get("front_image"),
+            sIm=images.get("side_image"),
+            bIm=images.get("back_image"),
+            eIm=images.get("end_image"),
             fillColour=fc,
             preserveSideAspect=self["preserve_side_aspect"].data,
             preserveEndAspect=self["preserve_end_aspect"].data,
         )
-        c.generate()
+        with phase("generate"):
+            c.generate()
         c.close()
-        buf.seek(0)
-        return buf
+        return buf.getvalue()
@@ -0,0 +1,122 @@
+"""Bounded handling of request bodies and uploads.
+
+Bodies larger than MAX_UPLOAD_MB are refused before they are parsed (or,
+behind API Gateway, before the event body is even decoded). File parts are
+spooled to disk past a threshold and checked while they are read: a part
+over MAX_FILE_MB, or an image whose header claims more pixels than the
+pipeline accepts, aborts the request with a 413. Spooled files live in a
+per-request directory under /tmp that is removed when the request ends, so
+warm containers don't accumulate ephemeral storage.
+
+The defaults suit the self-hosted server; app.py sets lower limits for
+lambda, which refuses invokes over 6 MB before any of this runs.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from flask import Request, g, has_request_context
+from image_pipeline import MAX_PIXELS
+from loguru import logger
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_UPLOAD_MB", 24)) * 2**20
+MAX_FILE_BYTES = int(os.environ.get("MAX_FILE_MB", 16)) * 2**20
+SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_KB", 512)) * 2**10
+SCRATCH_ROOT = os.environ.get("UPLOAD_SCRATCH_DIR", "/tmp/requests")
+# image headers (jpeg exif included) are normally well within this
+HEADER_BYTES = 256 * 2**10
+
+
+def scratch_dir():
+    """This request's temporary directory, created on first use."""
+    if not has_request_context():
+        return None
+    if "scratch_dir" not in g:
+        os.makedirs(SCRATCH_ROOT, exist_ok=True)
+        g.scratch_dir = tempfile.mkdtemp(dir=SCRATCH_ROOT)
+    return g.scratch_dir
+
+
+def cleanup_scratch_dir(exc=None):
+    path = g.pop("scratch_dir", None)
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def sweep(max_age=3600):
+    """Remove request directories left behind by invocations that died."""
+    if not os.path.isdir(SCRATCH_ROOT):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(SCRATCH_ROOT):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            logger.info(f"removing stale upload directory {entry.path}")
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class BoundedUpload(tempfile.SpooledTemporaryFile):
+    """Spooled upload that refuses to grow past a size or image-pixel limit."""
+
+    def __init__(self, filename=None):
+        super().__init__(max_size=SPOOL_THRESHOLD, mode="w+b", dir=scratch_dir())
+        self.filename = filename
+        self.written = 0
+        self.header = bytearray()
+
+    def write(self, b):
+        self.written += len(b)
+        if self.written > MAX_FILE_BYTES:
+            raise RequestEntityTooLarge(
+                f"{self.filename} is larger than {MAX_FILE_BYTES // 2**20} MB"
+            )
+        if self.header is not None:
+            self.check_header(b)
+        return super().write(b)
+
+    def check_header(self, b):
+        self.header += b
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                width, height = image.size
+        except Exception:
+            if len(self.header) >= HEADER_BYTES:
+                # not an image we can identify, leave it to the form validators
+                self.header = None
+            return
+        self.header = None
+        if width * height > MAX_PIXELS:
+            raise RequestEntityTooLarge(
+                f"{self.filename} is {width}x{height}, "
+                f"at most {MAX_PIXELS // 10**6} megapixels are accepted"
+            )
+
+
+class BoundedRequest(Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return BoundedUpload(filename)
+
+
+def event_too_large(event):
+    """Check a proxy event's body against the limit without decoding it."""
+    body = event.get("body") or ""
+    size = len(body)
+    if event.get("isBase64Encoded"):
+        size = size // 4 * 3
+    return size > MAX_CONTENT_LENGTH
+
+
+def too_large_response():
+    return {
+        "statusCode": 413,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"error": "Request too large"}),
+        "isBase64Encoded": False,
+    }
@@ -0,0 +1,72 @@
+"""Move the first request's one-off costs into container init.
+
+Rendering a small default of each generator imports the generators and
+reportlab's lazily loaded modules, registers the fonts from FONT_DIR and
+loads tab artwork. The card database and the text of each of
+WARMUP_LANGUAGES are then loaded into the card data cache.
+"""
+
+import os
+import time
+
+import artwork_tiers
+import card_db_cache
+import generation
+import prebuilt
+from loguru import logger
+
+HOT_LANGUAGES = [
+    language
+    for language in os.environ.get("WARMUP_LANGUAGES", "en_us").split(",")
+    if language
+]
+
+
+def default_submission(tag, **fields):
+    """The submission of ``tag``'s page as it loads, with ``fields`` changed."""
+    formdata = prebuilt.page_formdata(generation.FORMS[tag](formdata=None))
+    for name, value in fields.items():
+        formdata.setlist(name, [value])
+    return {"tag": tag, "form": formdata.to_dict(flat=False), "files": {}}
+
+
+def render_samples(tags=tuple(generation.FORMS)):
+    with generation.standalone_app().app_context():
+        for tag in tags:
+            form, files = generation.make_form(default_submission(tag))
+            form.validate()
+            # render directly, the generation cache would skip the work
+            if tag == "dominion_dividers":
+                options = form.clean_options()
+                options.num_pages = 1
+                options.tab_artwork_resolution = artwork_tiers.PREVIEW_TIER
+                form.render(options)
+            else:
+                form.render(files)
+
+
+def load_card_data(language):
+    with generation.standalone_app().app_context():
+        form, _ = generation.make_form(
+            default_submission("dominion_dividers", language=language)
+        )
+        if not form.validate():
+            logger.warning(f"can't warm up unknown language {language}")
+            return
+        card_db_cache.read_card_data(form.clean_options())
+        card_db_cache.language_text("cards", language)
+
+
+def warm():
+    start = time.perf_counter()
+    render_samples()
+    for language in HOT_LANGUAGES:
+        load_card_data(language)
+    logger.info(f"warmed up in {time.perf_counter() - start:.2f}s")
+
+
+def is_keep_warm(event):
+    """Whether a lambda event is a scheduled ping rather than a request."""
+    return isinstance(event, dict) and (
+        event.get("keep_warm") is True or event.get("source") == "aws.events"
+    )
@@ -0,0 +1,199 @@
+"""A pool of pre-warmed generator processes for the self-hosted server.
+
+Each worker imports the generators and renders a small warm-up once, then
+takes captured submissions (see ``generation.capture``) over a pipe. Workers
+are not daemonic so they can fork helpers of their own.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from io import BytesIO
+
+import generation
+import warmup
+from loguru import logger
+from timing import peak_rss_mb
+
+
+class PoolFull(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def worker_main(conn):
+    start = time.perf_counter()
+    warmup.warm()
+    logger.info(
+        f"worker {os.getpid()} warm after {time.perf_counter() - start:.2f}s, "
+        f"{peak_rss_mb():.0f} MB"
+    )
+    conn.send(("ready", None, peak_rss_mb()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        submission, kwargs = message
+        try:
+            buf = generation.generate(submission, **kwargs)
+        except generation.InvalidSubmission as e:
+            conn.send(("invalid", e.args[0], peak_rss_mb()))
+        except Exception as e:
+            logger.exception(f"worker {os.getpid()} failed on a {submission['tag']}")
+            conn.send(("error", repr(e), peak_rss_mb()))
+        else:
+            conn.send(("ok", buf.getvalue(), peak_rss_mb()))
+
+
+class Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child_conn,), daemon=False
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.rss_mb = 0
+
+    def wait_ready(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                raise WorkerCrashed(f"worker did not warm up in {timeout}s")
+            _, _, self.rss_mb = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.kill()
+            raise WorkerCrashed(f"worker exited with {self.process.exitcode}") from e
+        except WorkerCrashed:
+            self.kill()
+            raise
+        return self
+
+    def run(self, submission, kwargs, timeout):
+        self.conn.send((submission, kwargs))
+        try:
+            if not self.conn.poll(timeout):
+                self.kill()
+                raise JobTimeout(f"generation took longer than {timeout}s")
+            status, payload, self.rss_mb = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.kill()
+            raise WorkerCrashed(
+                f"worker {self.process.pid} exited with {self.process.exitcode}"
+            ) from e
+        self.jobs += 1
+        if status == "invalid":
+            raise generation.InvalidSubmission(payload)
+        if status == "error":
+            raise RuntimeError(payload)
+        return BytesIO(payload)
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        workers=None,
+        job_timeout=120,
+        max_jobs=200,
+        max_rss_mb=1024,
+        max_queue=16,
+        warm_timeout=120,
+    ):
+        self.size = workers or os.cpu_count()
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.warm_timeout = warm_timeout
+        # spawned workers start clean instead of inheriting the server's threads
+        self.context = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        # one slot per running job plus the allowed number of waiting ones
+        self.slots = threading.BoundedSemaphore(self.size + max_queue)
+        self.lock = threading.Lock()
+        # start all workers before waiting so they warm up in parallel
+        self.workers = [Worker(self.context) for _ in range(self.size)]
+        for worker in self.workers:
+            self.idle.put(worker.wait_ready(self.warm_timeout))
+        logger.info(f"started {self.size} generator workers")
+
+    def start_worker(self):
+        worker = Worker(self.context).wait_ready(self.warm_timeout)
+        with self.lock:
+            self.workers.append(worker)
+        return worker
+
+    def replace(self, worker, reason):
+        logger.info(f"recycling worker {worker.process.pid}: {reason}")
+        with self.lock:
+            self.workers.remove(worker)
+        if worker.alive:
+            worker.stop()
+        try:
+            self.idle.put(self.start_worker())
+        except WorkerCrashed:
+            logger.exception("could not replace worker, pool is shrinking")
+
+    def release(self, worker):
+        if not worker.alive:
+            reason = "exited"
+        elif self.max_jobs and worker.jobs >= self.max_jobs:
+            reason = f"ran {worker.jobs} jobs"
+        elif self.max_rss_mb and worker.rss_mb >= self.max_rss_mb:
+            reason = f"peak rss {worker.rss_mb:.0f} MB"
+        else:
+            self.idle.put(worker)
+            return
+        # warm the replacement off the request thread
+        threading.Thread(target=self.replace, args=(worker, reason)).start()
+
+    def generate(self, submission, **kwargs):
+        if not self.slots.acquire(blocking=False):
+            raise PoolFull("too many generation requests queued")
+        try:
+            try:
+                worker = self.idle.get(timeout=self.job_timeout)
+            except queue.Empty:
+                raise JobTimeout(f"no worker free within {self.job_timeout}s")
+            try:
+                return worker.run(submission, kwargs, self.job_timeout)
+            finally:
+                self.release(worker)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            workers = list(self.workers)
+            self.workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,86 @@
+"""Synthetic API Gateway (REST API, payload v1) proxy events for driving
+``apig_wsgi_handler`` without deploying."""
+
+import base64
+import uuid
+from urllib.parse import urlencode
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        for v in value if isinstance(value, list) else [value]:
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+                f"\r\n\r\n{v}\r\n".encode()
+            )
+    for name, (filename, data, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+            + data
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def make_event(method, path, form=None, files=None, query=None, headers=None):
+    """Build a proxy event; ``files`` maps field -> (filename, bytes, content type)."""
+    headers = {
+        "Host": "bench.execute-api.us-east-1.amazonaws.com",
+        "X-Forwarded-Proto": "https",
+        "X-Forwarded-For": "127.0.0.1",
+        **(headers or {}),
+    }
+    body = None
+    if files:
+        raw, headers["Content-Type"] = encode_multipart(form or {}, files)
+    elif form is not None:
+        raw = urlencode(form, doseq=True).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    else:
+        raw = None
+    if raw is not None:
+        # binary_media_types is */* so API Gateway always hands us base64
+        body = base64.b64encode(raw).decode("ascii")
+        headers["Content-Length"] = str(len(raw))
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": method,
+        "headers": headers,
+        "multiValueHeaders": {k: [v] for k, v in headers.items()},
+        "queryStringParameters": query or None,
+        "multiValueQueryStringParameters": (
+            {k: [v] for k, v in query.items()} if query else None
+        ),
+        "pathParameters": {"proxy": path.strip("/")},
+        "requestContext": {
+            "resourcePath": "/{proxy+}",
+            "httpMethod": method,
+            "path": f"/prod{path}",
+            "stage": "prod",
+            "requestId": str(uuid.uuid4()),
+        },
+        "body": body,
+        "isBase64Encoded": body is not None,
+    }
+
+
+def response_body(response):
+    body = response.get("body") or ""
+    if response.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+def response_mimetype(response):
+    headers = response.get("headers") or {
+        k: v[-1] for k, v in (response.get("multiValueHeaders") or {}).items()
+    }
+    content_type = next(
+        (v for k, v in headers.items() if k.lower() == "content-type"), ""
+    )
+    return content_type.partition(";")[0].strip()
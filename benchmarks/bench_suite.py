@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Benchmark the generators across a matrix of realistic form submissions.
+
+Each case is driven through the Flask test client and through
+``apig_wsgi_handler`` with synthetic API Gateway events. Results are written
+as JSON and can be compared against a saved baseline, so that e.g. a domdiv
+upgrade that regresses latency fails before deploy:
+
+    python benchmarks/bench_suite.py --out baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --out new.json
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from apig_events import make_event, response_body, response_mimetype
+from common import CHITBOX_FORM, DOMDIV_FORM, TUCKBOX_FORM, load_handlers, sample_image
+
+LANGUAGES = ["en_us", "de", "fr", "it", "nl_du"]
+
+
+def domdiv_cases(handlers):
+    from domdiv import db
+
+    form_class = handlers.DomDivForm
+    _, label_keys, _, _ = db.get_label_data()
+    variants = {"single-expansion": {}, "all-expansions": {"expansions": None}}
+    for wrapper in form_class.wrapper_choices:
+        variants[f"wrapper-{wrapper.lower()}"] = {"wrappers": wrapper}
+    for label in label_keys:
+        variants[f"label-{label}"] = {"pagesize": label}
+    for language in LANGUAGES:
+        if language in form_class.language_choices:
+            variants[f"language-{language}"] = {"language": language}
+
+    for kind, path in [
+        ("preview", "/preview/dominion_dividers/"),
+        ("full", "/"),
+    ]:
+        for variant, overrides in variants.items():
+            form = {**DOMDIV_FORM, **overrides}
+            form = {k: v for k, v in form.items() if v is not None}
+            yield {"name": f"dividers/{kind}/{variant}", "path": path, "form": form}
+
+
+def box_cases():
+    image = ("box.png", sample_image(), "image/png")
+    boxes = [
+        ("tuckbox", "tuckboxes", TUCKBOX_FORM, ["front_image", "side_image"]),
+        ("chitbox", "chitboxes", CHITBOX_FORM, ["main_image", "side_image"]),
+    ]
+    for name, tag, form, image_fields in boxes:
+        for kind, path in [("preview", f"/preview/{tag}/"), ("full", f"/{tag}/")]:
+            yield {"name": f"{name}/{kind}/no-images", "path": path, "form": form}
+            yield {
+                "name": f"{name}/{kind}/images",
+                "path": path,
+                "form": form,
+                "files": {field: image for field in image_fields},
+            }
+
+
+def run_client(client, case):
+    data = dict(case["form"])
+    for field, (filename, content, _) in case.get("files", {}).items():
+        data[field] = (BytesIO(content), filename)
+    response = client.post(case["path"], data=data)
+    return response.status_code, response.mimetype, len(response.data)
+
+
+def run_apig(handler, case):
+    event = make_event("POST", case["path"], case["form"], case.get("files"))
+    response = handler(event, None)
+    mimetype = response_mimetype(response)
+    return response["statusCode"], mimetype, len(response_body(response))
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(run, repeat, warmup):
+    peak_rss_before = peak_rss_mb()
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status, mimetype, size = run()
+        times.append(time.perf_counter() - start)
+        # invalid forms are answered with a 200 too, as JSON or the form page
+        assert (
+            status == 200 and mimetype == "application/pdf"
+        ), f"status {status}, {mimetype}"
+    # a separate traced run, tracemalloc slows generation down considerably
+    tracemalloc.start()
+    run()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "tracemalloc_peak_mb": traced_peak / 2**20,
+        # the process's peak only ever grows, so this is 0 for a case that
+        # needs no more memory than one before it
+        "peak_rss_growth_mb": peak_rss_mb() - peak_rss_before,
+        "output_bytes": size,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        for metric in ["median_s", "output_bytes"]:
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append(
+                    f"{key}: {metric} {base[metric]:.4g} -> {result[metric]:.4g}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", help="regex selecting case names to run")
+    parser.add_argument(
+        "--transport", choices=["client", "apig", "both"], default="both"
+    )
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown or size growth counted as a regression",
+    )
+    args = parser.parse_args()
+    # load_handlers changes into the lambda directory
+    out = args.out and os.path.abspath(args.out)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+
+    handlers = load_handlers()
+    client = handlers.flask_app.test_client()
+    transports = {
+        "client": lambda case: run_client(client, case),
+        "apig": lambda case: run_apig(handlers.apig_wsgi_handler, case),
+    }
+    if args.transport != "both":
+        transports = {args.transport: transports[args.transport]}
+
+    cases = [*domdiv_cases(handlers), *box_cases()]
+    if args.only:
+        cases = [case for case in cases if re.search(args.only, case["name"])]
+
+    results = {}
+    for case in cases:
+        for transport, run in transports.items():
+            key = f"{case['name']}@{transport}"
+            results[key] = measure(lambda: run(case), args.repeat, args.warmup)
+            r = results[key]
+            print(
+                f"{key:<50} {r['median_s'] * 1000:9.0f} ms "
+                f"{r['tracemalloc_peak_mb']:8.1f} MB traced "
+                f"{r['peak_rss_growth_mb']:7.1f} MB peak rss growth "
+                f"{r['output_bytes']:>10} bytes",
+                flush=True,
+            )
+
+    import domdiv
+
+    output = {
+        "meta": {
+            "domdiv_version": domdiv.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "date": dt.datetime.now().isoformat(timespec="seconds"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if out:
+        with open(out, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(
+            f"compared against domdiv {baseline['meta']['domdiv_version']} baseline: "
+            f"{len(regressions)} regression(s)"
+        )
+        for regression in regressions:
+            print(f"  {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
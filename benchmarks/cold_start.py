@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure cold-start import time of the lambda modules with and without the
+build-time choice snapshot.
+
+Every sample is a fresh interpreter, as on a lambda cold start.
+Run from the repository root: python benchmarks/cold_start.py
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import LAMBDA_DIR
+
+# statement to time in a fresh interpreter, after an untimed setup
+CASES = {
+    "load choices": ("import choice_snapshot", "choice_snapshot.load_choices()"),
+    "import domdiv_form": ("", "import domdiv_form"),
+}
+TIMER = """
+import time
+{setup}
+start = time.perf_counter()
+{stmt}
+print(time.perf_counter() - start)
+"""
+
+
+def sample(setup, stmt, snapshot_path, repeat):
+    env = dict(
+        os.environ,
+        DOMDIV_CHOICE_SNAPSHOT=snapshot_path,
+        FLASK_SECRET_KEY="benchmark",
+        LOG_LEVEL="WARNING",
+        GENERATION_CACHE="0",
+    )
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", TIMER.format(setup=setup, stmt=stmt)],
+            cwd=LAMBDA_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "choice_snapshot.json")
+        subprocess.run(
+            [sys.executable, "choice_snapshot.py", snapshot],
+            cwd=LAMBDA_DIR,
+            env=dict(os.environ, LOG_LEVEL="WARNING"),
+            check=True,
+            capture_output=True,
+        )
+        results = {}
+        for case, (setup, stmt) in CASES.items():
+            missing = os.path.join(tmp, "missing.json")
+            live = sample(setup, stmt, missing, args.repeat)
+            snapped = sample(setup, stmt, snapshot, args.repeat)
+            results[case] = {"live_s": live, "snapshot_s": snapped}
+            print(
+                f"{case:<20} live {live * 1000:7.1f} ms   "
+                f"snapshot {snapped * 1000:7.1f} ms   "
+                f"saved {(live - snapped) * 1000:6.1f} ms"
+            )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
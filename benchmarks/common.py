@@ -0,0 +1,69 @@
+import importlib
+import os
+import sys
+from io import BytesIO
+
+LAMBDA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "assets", "lambda"
+)
+
+# the default submission of the dominion dividers form
+DOMDIV_FORM = {
+    "expansions": "dominion2ndEdition",
+    "orientation": "horizontal",
+    "pagesize": "Letter",
+    "cardsize": "Unsleeved",
+    "tabwidth": "4.0",
+    "back_offset": "0",
+    "back_offset_height": "0",
+    "horizontal_gap": "0",
+    "vertical_gap": "0",
+    "edition": "all",
+    "linetype": "line",
+    "wrappers": "Dividers",
+    "expansion_reset_tabs": "y",
+    "tab_name_align": "left",
+    "tab_number": "1",
+    "tab_side": "left",
+    "order": "expansion",
+    "group_special": "y",
+    "set_icon": "tab",
+    "cost": "tab",
+    "language": "en_us",
+    "text_front": "card",
+    "text_back": "rules",
+}
+TUCKBOX_FORM = {
+    "width": "6",
+    "height": "9.3",
+    "depth": "3",
+    "fill_colour": "#99FF99",
+    "preserve_side_aspect": "y",
+    "preserve_end_aspect": "y",
+}
+CHITBOX_FORM = {"width": "5", "length": "5", "height": "2"}
+
+
+def load_handlers(**environ):
+    """Import lambda-handlers the way the lambda runtime does, with benchmark defaults."""
+    os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+    os.environ.setdefault("STATIC_WEB_URL", "http://localhost")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # measure generation, not the result cache
+    os.environ.setdefault("GENERATION_CACHE", "0")
+    os.environ.update(environ)
+    sys.path.insert(0, LAMBDA_DIR)
+    os.chdir(LAMBDA_DIR)
+    return importlib.import_module("lambda-handlers")
+
+
+def sample_image(width=1200, height=900, fmt="PNG"):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), (40, 90, 160))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, width, 40):
+        draw.line([(i, 0), (width - i, height)], fill=(230, 200, 40), width=3)
+    buf = BytesIO()
+    image.save(buf, fmt)
+    return buf.getvalue()
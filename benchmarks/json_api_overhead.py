@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Per-request overhead of the JSON API compared with the HTML form.
+
+"options" times turning a submission into cleaned options: WTForms
+validation, populate_obj and clean_options for the form, one pass over the
+schema and build_options for JSON. "request" times a whole request through
+the test client for a PDF already in the generation cache, so generation
+itself drops out and what is left is the overhead around it.
+
+Run from the repository root: python benchmarks/json_api_overhead.py
+"""
+
+import argparse
+import statistics
+import time
+
+from common import DOMDIV_FORM, load_handlers
+
+# not one of the prebuilt configurations, which the form would redirect to
+FORM = {**DOMDIV_FORM, "tabwidth": "3.5"}
+JSON = {
+    "tabwidth": 3.5,
+    "expansions": ["dominion2ndEdition"],
+    "expansion_reset_tabs": True,
+    "group_special": True,
+}
+API_PATH = "/api/v1/dominion_dividers/"
+
+
+def timed(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    handlers = load_handlers(GENERATION_CACHE="1")
+    import json_api
+    from domdiv_form import DomDivForm
+
+    def form_options():
+        with handlers.flask_app.test_request_context("/", method="POST", data=FORM):
+            form = DomDivForm(font_dir=None)
+            assert form.validate()
+            return form.clean_options()
+
+    def json_options():
+        values, errors = json_api.validate(JSON)
+        assert not errors
+        return json_api.options(values)
+
+    # the same options either way, so both requests hit the same cached PDF
+    assert vars(form_options()) == vars(json_options())
+
+    client = handlers.flask_app.test_client()
+
+    def form_request():
+        response = client.post("/", data=FORM)
+        assert response.status_code == 200, response.status_code
+
+    def json_request():
+        response = client.post(API_PATH, json=JSON)
+        assert response.status_code == 200, response.status_code
+
+    form_request()
+    json_api.schema()
+    for stage, form_run, json_run in [
+        ("options", form_options, json_options),
+        ("request", form_request, json_request),
+    ]:
+        form_s = timed(form_run, args.repeat)
+        json_s = timed(json_run, args.repeat)
+        print(
+            f"{stage:<8} form {form_s * 1000:7.2f} ms   json {json_s * 1000:7.2f} ms"
+            f"   saved {(form_s - json_s) * 1000:6.2f} ms ({form_s / json_s:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Replay a seeded mix of API Gateway events against ``apig_wsgi_handler``.
+
+Requests are drawn from MIX (page loads, divider previews and PDFs, tuckbox
+and chitbox submissions with uploaded images) with variations picked by a
+seeded random generator, so the same --seed replays the same traffic.
+
+With --containers 0 everything runs in this process after an untimed import.
+Otherwise each container is a fresh interpreter, as on a lambda cold start,
+started --concurrency at a time: its import time is the init time and its
+first request the cold one. The report has init time, latency percentiles
+per kind of request, throughput per core and error rates.
+
+Run from the repository root:
+
+    python benchmarks/load_test.py --requests 200 --containers 0
+    python benchmarks/load_test.py --requests 60 --containers 6 --concurrency 2
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from apig_events import make_event, response_body
+from common import CHITBOX_FORM, DOMDIV_FORM, TUCKBOX_FORM, load_handlers, sample_image
+
+# relative weight of each kind of request
+MIX = {
+    "page/dividers": 30,
+    "page/tuckboxes": 6,
+    "page/chitboxes": 4,
+    "dividers/preview": 30,
+    "dividers/full": 15,
+    "tuckbox/preview": 6,
+    "tuckbox/full": 4,
+    "chitbox/full": 5,
+}
+EXPANSIONS = [
+    "dominion2ndEdition",
+    "intrigue2ndEdition",
+    "seaside2ndEdition",
+    "prosperity2ndEdition",
+    "hinterlands2ndEdition",
+    "cornucopiaAndGuilds2ndEdition",
+    "dark ages",
+    "adventures",
+    "empires",
+    "nocturne",
+]
+LANGUAGES = ["en_us", "de", "fr", "it", "nl_nl"]
+PAGESIZES = ["Letter", "A4", "Legal", "A3"]
+IMAGE_SIZES = [(600, 450), (1200, 900), (2400, 1800)]
+PAGES = {
+    "page/dividers": "/",
+    "page/tuckboxes": "/tuckboxes/",
+    "page/chitboxes": "/chitboxes/",
+}
+WORKER = """
+import json, sys, time
+start = time.perf_counter()
+from load_test import load_handlers, run_events
+handler = load_handlers().apig_wsgi_handler
+init = time.perf_counter() - start
+with open(sys.argv[1]) as f:
+    spec = json.load(f)
+print(json.dumps({"init_s": init, "results": run_events(handler, spec)}))
+"""
+
+
+def dividers_form(rng):
+    form = dict(DOMDIV_FORM)
+    form["expansions"] = rng.sample(EXPANSIONS, rng.choice([1, 1, 2, 3]))
+    form["language"] = rng.choice(LANGUAGES)
+    form["pagesize"] = rng.choice(PAGESIZES)
+    if rng.random() < 0.2:
+        form["wrappers"] = "Slipcases"
+    return form
+
+
+def traffic(seed, count, mix=MIX):
+    """``count`` request specs, the same ones for the same seed."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    specs = []
+    for kind in kinds:
+        spec = {"kind": kind}
+        if kind in PAGES:
+            spec.update(method="GET", path=PAGES[kind])
+        elif kind.startswith("dividers/"):
+            spec.update(method="POST", form=dividers_form(rng))
+            spec["path"] = (
+                "/preview/dominion_dividers/" if kind.endswith("preview") else "/"
+            )
+        elif kind.startswith("tuckbox/"):
+            form = dict(TUCKBOX_FORM, depth=str(rng.choice([2, 3, 4, 5])))
+            fields = rng.sample(["front_image", "side_image", "back_image"], 2)
+            spec.update(method="POST", form=form, images=fields)
+            spec["path"] = (
+                "/preview/tuckboxes/" if kind.endswith("preview") else "/tuckboxes/"
+            )
+        else:
+            form = dict(CHITBOX_FORM, height=str(rng.choice([1, 2, 3])))
+            spec.update(method="POST", form=form, path="/chitboxes/")
+            spec["images"] = rng.sample(["main_image", "side_image"], 1)
+        # image dimensions are drawn here too, to keep the sequence independent
+        # of which process builds the event
+        spec["image_size"] = list(rng.choice(IMAGE_SIZES))
+        specs.append(spec)
+    return specs
+
+
+def build_event(spec, images):
+    files = None
+    if spec.get("images"):
+        size = tuple(spec["image_size"])
+        if size not in images:
+            images[size] = sample_image(*size)
+        image = ("box.png", images[size], "image/png")
+        files = {field: image for field in spec["images"]}
+    return make_event(spec["method"], spec["path"], spec.get("form"), files)
+
+
+def run_events(handler, specs):
+    """Time each request; build the events first so uploads aren't timed."""
+    images = {}
+    events = [build_event(spec, images) for spec in specs]
+    results = []
+    for spec, event in zip(specs, events):
+        start = time.perf_counter()
+        try:
+            response = handler(event, None)
+            status = response["statusCode"]
+            body = response_body(response)
+            size = len(body)
+            # invalid forms are answered with a 200 and an error message
+            if body.startswith(b'{"error"'):
+                status = json.loads(body)["error"]
+        except Exception as e:
+            status, size = repr(e), 0
+        results.append(
+            {
+                "kind": spec["kind"],
+                "latency_s": time.perf_counter() - start,
+                "status": status,
+                "bytes": size,
+            }
+        )
+    return results
+
+
+def run_containers(specs, containers, concurrency, environ, tmp):
+    """Split ``specs`` over cold ``containers``, at most ``concurrency`` at once."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    env.update(environ)
+    pending = []
+    for index in range(containers):
+        path = os.path.join(tmp, f"container-{index}.json")
+        with open(path, "w") as f:
+            json.dump(specs[index::containers], f)
+        pending.append((index, path))
+    running = []
+    outputs = [None] * containers
+    while pending or running:
+        while pending and len(running) < concurrency:
+            index, path = pending.pop(0)
+            proc = subprocess.Popen(
+                [sys.executable, "-c", WORKER, path],
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            running.append((index, proc))
+        # wait for the oldest, containers get equal shares
+        index, proc = running.pop(0)
+        out = proc.stdout.read()
+        if proc.wait() != 0:
+            raise RuntimeError(f"container {index} exited with {proc.returncode}")
+        outputs[index] = json.loads(out.strip().splitlines()[-1])
+    return outputs
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def is_error(result):
+    return not isinstance(result["status"], int) or result["status"] >= 400
+
+
+def summarize(results):
+    latencies = [r["latency_s"] for r in results]
+    return {
+        "requests": len(results),
+        "errors": sum(is_error(r) for r in results),
+        "error_rate": sum(is_error(r) for r in results) / len(results),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies),
+    }
+
+
+def report(results, init_times, wall, cores):
+    by_kind = {}
+    for result in results:
+        by_kind.setdefault(result["kind"], []).append(result)
+    summary = {
+        "all": summarize(results),
+        "kinds": {kind: summarize(rs) for kind, rs in sorted(by_kind.items())},
+        "wall_s": wall,
+        "cores": cores,
+        "throughput_per_core": len(results) / wall / cores,
+    }
+    if init_times:
+        summary["init_s"] = {
+            "median": statistics.median(init_times),
+            "max": max(init_times),
+        }
+
+    def line(name, s):
+        print(
+            f"{name:<22} {s['requests']:>5} req {s['error_rate']:6.1%} errors   "
+            f"p50 {s['p50_s'] * 1000:7.0f}  p95 {s['p95_s'] * 1000:7.0f}  "
+            f"p99 {s['p99_s'] * 1000:7.0f} ms"
+        )
+
+    for kind, s in summary["kinds"].items():
+        line(kind, s)
+    line("all", summary["all"])
+    if init_times:
+        print(
+            f"init {len(init_times)} containers: median "
+            f"{summary['init_s']['median'] * 1000:.0f} ms, "
+            f"max {summary['init_s']['max'] * 1000:.0f} ms"
+        )
+    print(
+        f"{len(results)} requests in {wall:.1f}s on {cores} core(s): "
+        f"{summary['throughput_per_core']:.2f} req/s per core"
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument(
+        "--containers",
+        type=int,
+        default=0,
+        help="cold containers to spread the requests over, 0 to run in-process",
+    )
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--generation-cache",
+        action="store_true",
+        help="keep the generation cache on, as deployed",
+    )
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+    out = args.json and os.path.abspath(args.json)
+
+    environ = {"GENERATION_CACHE": "1" if args.generation_cache else "0"}
+    specs = traffic(args.seed, args.requests)
+    init_times = []
+    if args.containers:
+        cores = min(args.concurrency, args.containers, os.cpu_count())
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = run_containers(
+                specs, args.containers, args.concurrency, environ, tmp
+            )
+        wall = time.perf_counter() - start
+        results = [r for output in outputs for r in output["results"]]
+        init_times = [output["init_s"] for output in outputs]
+        cold = [output["results"][0] for output in outputs if output["results"]]
+    else:
+        cores = 1
+        handler = load_handlers(**environ).apig_wsgi_handler
+        start = time.perf_counter()
+        results = run_events(handler, specs)
+        wall = time.perf_counter() - start
+        cold = []
+
+    summary = report(results, init_times, wall, cores)
+    if cold:
+        summary["cold"] = summarize(cold)
+        s = summary["cold"]
+        print(
+            f"first request per container: p50 {s['p50_s'] * 1000:.0f} ms, "
+            f"max {s['max_s'] * 1000:.0f} ms"
+        )
+    summary["meta"] = {
+        "seed": args.seed,
+        "requests": args.requests,
+        "containers": args.containers,
+        "concurrency": args.concurrency,
+    }
+    if out:
+        with open(out, "w") as f:
+            json.dump(summary, f, indent=2)
+    if summary["all"]["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
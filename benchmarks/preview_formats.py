@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Compare the base64-PDF preview with the raster preview formats.
+
+Run from the repository root: python benchmarks/preview_formats.py
+"""
+
+import argparse
+import statistics
+import time
+
+from common import DOMDIV_FORM, load_handlers
+
+CASES = {
+    "single expansion": {},
+    "all expansions": {"expansions": []},
+    "slipcases": {"wrappers": "Slipcases"},
+}
+
+
+def measure(client, url, form, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post(url, data=form)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(times), len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=72)
+    args = parser.parse_args()
+
+    client = load_handlers().flask_app.test_client()
+    formats = ["pdf", "png", "webp"]
+    print(f"{'case':<20}{'format':<8}{'median ms':>12}{'bytes':>12}")
+    for case, overrides in CASES.items():
+        form = {**DOMDIV_FORM, **overrides}
+        # warm fonts and artwork so the first format isn't penalised
+        client.post("/preview/dominion_dividers/", data=form)
+        for fmt in formats:
+            url = "/preview/dominion_dividers/"
+            if fmt != "pdf":
+                url += f"?format={fmt}&dpi={args.dpi}"
+            median, size = measure(client, url, form, args.repeat)
+            print(f"{case:<20}{fmt:<8}{median * 1000:>12.0f}{size:>12}")
+
+
+if __name__ == "__main__":
+    main()
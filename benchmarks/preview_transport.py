@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Compare the binary PDF preview with the legacy base64-in-JSON one.
+
+The generation cache is kept in memory and warmed first, so the peak traced
+memory is that of the transport alone. "wire" is what the browser receives,
+"lambda" the size of the body in the response handed back to API Gateway.
+
+Run from the repository root: python benchmarks/preview_transport.py
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from apig_events import make_event
+from common import DOMDIV_FORM, load_handlers
+
+CASES = {
+    "single expansion": {},
+    "all expansions": {"expansions": []},
+    "slipcases": {"wrappers": "Slipcases"},
+}
+PATH = "/preview/dominion_dividers/"
+TRANSPORTS = {"json": {"format": "json"}, "pdf": {}}
+
+
+def traced(run):
+    tracemalloc.start()
+    try:
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    handlers = load_handlers(GENERATION_CACHE="1", GENERATION_CACHE_DISK_MB="0")
+    client = handlers.flask_app.test_client()
+    print(
+        f"{'case':<20}{'transport':<10}{'median ms':>10}{'client MB':>11}"
+        f"{'apig MB':>9}{'wire bytes':>12}{'lambda bytes':>14}"
+    )
+    for case, overrides in CASES.items():
+        form = {**DOMDIV_FORM, **overrides}
+        client.post(PATH, data=form)
+        for transport, query in TRANSPORTS.items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.post(PATH, data=form, query_string=query)
+                times.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.status_code
+            response, client_peak = traced(
+                lambda: client.post(PATH, data=form, query_string=query)
+            )
+            event = make_event("POST", PATH, form, query=query)
+            apig_response, apig_peak = traced(
+                lambda: handlers.apig_wsgi_handler(event, None)
+            )
+            print(
+                f"{case:<20}{transport:<10}{statistics.median(times) * 1000:>10.1f}"
+                f"{client_peak / 2**20:>11.2f}{apig_peak / 2**20:>9.2f}"
+                f"{len(response.data):>12}{len(apig_response['body']):>14}"
+            )
+
+
+if __name__ == "__main__":
+    main()
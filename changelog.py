@@ -0,0 +1,99 @@
+"""Changelog of domdiv releases for the generated page template.
+
+Releases are kept in CHANGELOG_CACHE along with the ETag GitHub sent for
+them. Each synth asks with If-None-Match, so an unchanged list costs a
+single 304 (free of rate limit with a GITHUB_TOKEN) and nothing is
+downloaded. The template is only rendered again when the releases or
+the template's source changed. With CHANGELOG_OFFLINE=1, or if GitHub
+can't be reached, the cached copy is used as is.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+
+import requests
+
+RELEASES_URL = os.environ.get(
+    "CHANGELOG_RELEASES_URL",
+    "https://api.github.com/repos/sumpfork/dominiontabs/releases",
+)
+CACHE_PATH = os.environ.get("CHANGELOG_CACHE", ".cache/changelog.json")
+OFFLINE = os.environ.get("CHANGELOG_OFFLINE") == "1"
+# as many as the releases api returned by default before, all on one page
+MAX_RELEASES = 30
+RELEASE_FIELDS = ["id", "html_url", "published_at", "name", "tag_name", "body"]
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"etag": None, "releases": []}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(cache, f, indent=1)
+
+
+def fetch_releases(cache, url=RELEASES_URL, session=requests):
+    """Bring ``cache`` up to date; returns whether its releases changed."""
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    if cache["etag"]:
+        headers["If-None-Match"] = cache["etag"]
+    # the first page holds every release that is shown
+    r = session.get(url, headers=headers, params={"per_page": MAX_RELEASES}, timeout=10)
+    if r.status_code == 304:
+        return False
+    r.raise_for_status()
+    releases = [{k: release.get(k) for k in RELEASE_FIELDS} for release in r.json()]
+    changed = releases != cache["releases"]
+    cache.update(etag=r.headers.get("ETag"), releases=releases)
+    return changed
+
+
+def changelog_entries(releases):
+    return [
+        {
+            "url": release["html_url"],
+            "date": dt.datetime.strptime(
+                release["published_at"][:10], "%Y-%m-%d"
+            ).date(),
+            "name": release["name"],
+            "tag": release["tag_name"],
+            "description": release["body"],
+        }
+        for release in releases
+    ]
+
+
+def template_digest(template):
+    source, _, _ = template.environment.loader.get_source(
+        template.environment, template.name
+    )
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def update(template, out_path, cache_path=CACHE_PATH):
+    """Render ``template`` with the changelog to ``out_path`` if it changed."""
+    cache = load_cache(cache_path)
+    changed = False
+    if OFFLINE:
+        print(f"Offline, using {len(cache['releases'])} cached releases")
+    else:
+        try:
+            changed = fetch_releases(cache)
+        except requests.RequestException as e:
+            print(f"Couldn't fetch releases ({e}), using the cached ones")
+    digest = template_digest(template)
+    if changed or digest != cache.get("template") or not os.path.exists(out_path):
+        with open(out_path, "w") as f:
+            f.write(template.render(changelog=changelog_entries(cache["releases"])))
+        cache["template"] = digest
+    save_cache(cache, cache_path)
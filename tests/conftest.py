@@ -0,0 +1,7 @@
+import os
+
+# what the lambda modules read at import, before any test imports them
+os.environ.setdefault("FLASK_SECRET_KEY", "test")
+os.environ.setdefault("STATIC_WEB_URL", "http://localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("GENERATION_CACHE", "0")
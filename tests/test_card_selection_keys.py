@@ -0,0 +1,105 @@
+"""The selection cache in card_db_cache keys on every option selection reads.
+
+Each variant of the default dividers form (every field changed on its own)
+is selected through options that note which attributes domdiv reads and
+writes. Anything read outside READ_OPTIONS + SELECT_OPTIONS would be
+missing from the cache key, and anything written outside SELECTED_OPTIONS
+would be lost on a cache hit.
+"""
+
+import argparse
+import copy
+
+import card_db_cache
+import domdiv.main
+import generation
+import pytest
+from domdiv import db
+from domdiv_form import DomDivForm
+from prebuilt import page_formdata
+
+
+class TracedOptions(argparse.Namespace):
+    """Options noting the names of those read and written."""
+
+    reads = set()
+    writes = set()
+
+    def __getattribute__(self, name):
+        if not name.startswith("_"):
+            TracedOptions.reads.add(name)
+        return super().__getattribute__(name)
+
+    def __setattr__(self, name, value):
+        TracedOptions.writes.add(name)
+        super().__setattr__(name, value)
+
+
+def form_variants(form, formdata):
+    """Form data for the defaults and for each field changed on its own."""
+    yield "defaults", formdata
+    for field in form:
+        if field.type == "BooleanField":
+            values = [[] if field.data else ["y"]]
+        elif field.type == "SelectMultipleField":
+            # no expansions selected means all of them
+            values = [[]] if field.name == "expansions" else []
+            values.append([str(value) for value, _ in field.choices])
+        elif field.type in ["SelectField", "RadioField"]:
+            values = [[str(v)] for v, _ in field.choices if str(v) != str(field.data)]
+        else:
+            continue
+        for value in values:
+            variant = formdata.copy()
+            variant.setlist(field.name, value)
+            yield f"{field.name}={value}", variant
+
+
+def all_variants():
+    with generation.standalone_app().test_request_context():
+        blank = DomDivForm(formdata=None)
+        return list(form_variants(blank, page_formdata(blank)))
+
+
+VARIANTS = all_variants()
+
+
+@pytest.fixture(
+    params=[formdata for _, formdata in VARIANTS], ids=[v for v, _ in VARIANTS]
+)
+def options(request):
+    with generation.standalone_app().test_request_context():
+        form = DomDivForm(formdata=request.param)
+        assert form.validate(), form.errors
+        return form.clean_options()
+
+
+def traced_selection(options):
+    traced = TracedOptions(**vars(options))
+    TracedOptions.reads, TracedOptions.writes = set(), set()
+    cards = domdiv.main.filter_sort_cards(db.read_card_data(traced), traced)
+    return traced, cards
+
+
+def test_selection_reads_only_keyed_options(options):
+    traced_selection(options)
+    keyed = set(card_db_cache.READ_OPTIONS + card_db_cache.SELECT_OPTIONS)
+    assert TracedOptions.reads - keyed == set()
+
+
+def test_selection_rewrites_only_selected_options(options):
+    traced_selection(options)
+    assert TracedOptions.writes - set(card_db_cache.SELECTED_OPTIONS) == set()
+
+
+def test_cached_selection_is_the_same(options):
+    traced, cards = traced_selection(copy.deepcopy(options))
+    # the second call is served from the cache
+    card_db_cache.select_cards(copy.deepcopy(options))
+    cached_options = copy.deepcopy(options)
+    cached = card_db_cache.select_cards(cached_options)
+    assert [(c.card_tag, c.name) for c in cached] == [
+        (c.card_tag, c.name) for c in cards
+    ]
+    for name in card_db_cache.SELECTED_OPTIONS:
+        assert getattr(cached_options, name) == getattr(traced, name)
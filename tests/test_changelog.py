@@ -0,0 +1,166 @@
+import hashlib
+import importlib
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "github_releases.json")
+
+
+class ReleasesServer(ThreadingHTTPServer):
+    """Stand-in for GitHub's releases API that honours If-None-Match."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ReleasesHandler)
+        with open(FIXTURE) as f:
+            self.releases = json.load(f)
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/releases"
+
+    def etag(self):
+        body = json.dumps(self.releases).encode("utf-8")
+        return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+class ReleasesHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        etag = self.server.etag()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.releases).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ReleasesServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def load_changelog(monkeypatch, tmp_path):
+    def load(url, offline=False):
+        monkeypatch.setenv("CHANGELOG_RELEASES_URL", url)
+        monkeypatch.setenv("CHANGELOG_CACHE", str(tmp_path / "changelog.json"))
+        monkeypatch.setenv("CHANGELOG_OFFLINE", "1" if offline else "0")
+        monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+        import changelog
+
+        # settings are read at import
+        return importlib.reload(changelog)
+
+    return load
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    directory = tmp_path / "templates"
+    directory.mkdir()
+    (directory / "changelog.html.j2").write_text(
+        "{% for entry in changelog %}{{ entry.tag }} {{ entry.date }}\n{% endfor %}"
+    )
+    return directory
+
+
+def render(changelog, template_dir, out_path):
+    env = Environment(loader=FileSystemLoader(str(template_dir)))
+    changelog.update(env.get_template("changelog.html.j2"), str(out_path))
+
+
+def unreachable_url():
+    # a port that was just free, so nothing answers on it
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/releases"
+
+
+def test_fetch_then_not_modified(server, load_changelog, template_dir, tmp_path):
+    changelog = load_changelog(server.url)
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    assert out_path.read_text().splitlines() == [
+        "v4.2.0 2024-05-02",
+        "v4.1.0 2023-11-20",
+        "v4.0.0 2023-06-01",
+    ]
+    assert "If-None-Match" not in server.requests[0]
+    cache = changelog.load_cache()
+    assert cache["etag"] == server.etag()
+    assert set(cache["releases"][0]) == set(changelog.RELEASE_FIELDS)
+
+    # unchanged releases are a 304 and the page isn't rendered again
+    out_path.write_text("kept")
+    render(changelog, template_dir, out_path)
+    assert server.requests[1]["If-None-Match"] == server.etag()
+    assert out_path.read_text() == "kept"
+
+
+def test_new_release_renders_again(server, load_changelog, template_dir, tmp_path):
+    changelog = load_changelog(server.url)
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    server.releases.insert(0, dict(server.releases[0], id=4, tag_name="v4.3.0"))
+    render(changelog, template_dir, out_path)
+    assert out_path.read_text().splitlines()[0] == "v4.3.0 2024-05-02"
+
+
+def test_template_change_renders_again(server, load_changelog, template_dir, tmp_path):
+    changelog = load_changelog(server.url)
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    (template_dir / "changelog.html.j2").write_text(
+        "{% for entry in changelog %}{{ entry.name }}\n{% endfor %}"
+    )
+    render(changelog, template_dir, out_path)
+    assert len(server.requests) == 2
+    assert out_path.read_text().splitlines() == ["4.2.0", "4.1.0", "4.0.0"]
+
+
+def test_offline_uses_cache(server, load_changelog, template_dir, tmp_path):
+    render(load_changelog(server.url), template_dir, tmp_path / "first.html")
+    changelog = load_changelog(server.url, offline=True)
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    assert len(server.requests) == 1
+    assert out_path.read_text() == (tmp_path / "first.html").read_text()
+
+
+def test_offline_without_cache(load_changelog, template_dir, tmp_path):
+    changelog = load_changelog(unreachable_url(), offline=True)
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    assert out_path.read_text() == ""
+
+
+def test_unreachable_server_falls_back(server, load_changelog, template_dir, tmp_path):
+    render(load_changelog(server.url), template_dir, tmp_path / "first.html")
+    changelog = load_changelog(unreachable_url())
+    out_path = tmp_path / "changelog.html"
+    render(changelog, template_dir, out_path)
+    assert out_path.read_text() == (tmp_path / "first.html").read_text()
+    # the cached releases and their ETag survive the failed fetch
+    assert changelog.load_cache()["etag"] == server.etag()
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+from generation_cache import DiskTier, GenerationCache, MemoryTier, ObjectStoreTier
+from object_store import LocalDirectoryStore, ObjectStore
+
+
+def make_cache(tmp_path, container, memory_items=4, disk_bytes=2**20):
+    """A cache as one container has it: its own memory and disk, a shared store."""
+    return GenerationCache(
+        [
+            MemoryTier(memory_items, 2**20),
+            DiskTier(str(tmp_path / container / "disk"), disk_bytes),
+            ObjectStoreTier(LocalDirectoryStore(str(tmp_path / "store"))),
+        ]
+    )
+
+
+def test_miss_then_hit_in_memory(tmp_path):
+    cache = make_cache(tmp_path, "a")
+    assert cache.get("k") is None
+    cache.put("k", b"pdf")
+    assert cache.get("k") == b"pdf"
+    assert cache.stats == {
+        "memory_miss": 1,
+        "disk_miss": 1,
+        "object_store_miss": 1,
+        "memory_hit": 1,
+        "memory_evict": 0,
+        "disk_evict": 0,
+        "object_store_evict": 0,
+    }
+
+
+def test_other_container_hits_store_and_promotes(tmp_path):
+    make_cache(tmp_path, "a").put("k", b"pdf")
+    cache = make_cache(tmp_path, "b")
+    assert cache.get("k") == b"pdf"
+    assert cache.stats["memory_miss"] == 1
+    assert cache.stats["disk_miss"] == 1
+    assert cache.stats["object_store_hit"] == 1
+    # promoted into the faster tiers, so the next read stops at memory
+    assert cache.get("k") == b"pdf"
+    assert cache.stats["memory_hit"] == 1
+    assert cache.tiers[1].get("k") == b"pdf"
+
+
+def test_disk_hit_after_memory_eviction(tmp_path):
+    cache = make_cache(tmp_path, "a", memory_items=2)
+    for key in ["k1", "k2", "k3"]:
+        cache.put(key, key.encode())
+    assert cache.stats["memory_evict"] == 1
+    assert cache.get("k1") == b"k1"
+    assert cache.stats["memory_miss"] == 1
+    assert cache.stats["disk_hit"] == 1
+
+
+def test_memory_evicts_least_recently_used():
+    tier = MemoryTier(max_items=2, max_bytes=2**20)
+    tier.put("k1", b"1")
+    tier.put("k2", b"2")
+    tier.get("k1")
+    assert tier.put("k3", b"3") == 1
+    assert tier.get("k2") is None
+    assert tier.get("k1") == b"1"
+
+
+def test_memory_byte_cap():
+    tier = MemoryTier(max_items=10, max_bytes=10)
+    assert tier.put("big", b"x" * 11) == 0
+    assert tier.get("big") is None
+    tier.put("k1", b"x" * 6)
+    assert tier.put("k2", b"x" * 6) == 1
+    assert tier.get("k1") is None
+    assert tier.size == 6
+
+
+def test_disk_cap_evicts_oldest(tmp_path):
+    tier = DiskTier(str(tmp_path / "disk"), max_bytes=250)
+    for age, key in enumerate(["k1", "k2"]):
+        tier.put(key, b"x" * 100)
+        # mtime is the LRU clock, keep it apart from the write order
+        os.utime(tier._path(key), (1000 + age, 1000 + age))
+    tier.get("k1")
+    assert tier.put("k3", b"x" * 100) == 1
+    assert tier.get("k2") is None
+    assert tier.get("k1") is not None
+    assert tier.get("k3") is not None
+
+
+def test_disk_skips_entries_over_cap(tmp_path):
+    tier = DiskTier(str(tmp_path / "disk"), max_bytes=10)
+    assert tier.put("big", b"x" * 11) == 0
+    assert tier.get("big") is None
+
+
+def test_generates_once(tmp_path):
+    cache = make_cache(tmp_path, "a")
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return b"pdf"
+
+    assert cache.get_or_generate("k", generate) == b"pdf"
+    assert cache.get_or_generate("k", generate) == b"pdf"
+    assert len(calls) == 1
+
+
+def test_failing_tier_is_skipped(tmp_path):
+    class Broken:
+        name = "broken"
+
+        def get(self, key):
+            raise OSError("unreachable")
+
+        def put(self, key, data):
+            raise OSError("unreachable")
+
+    cache = GenerationCache([Broken(), MemoryTier(4, 2**20)])
+    cache.put("k", b"pdf")
+    assert cache.get("k") == b"pdf"
+    assert cache.stats["memory_hit"] == 1
+
+
+@pytest.mark.parametrize("key", ["../outside", "a/../../outside", "/etc/passwd"])
+def test_store_rejects_keys_outside_its_root(tmp_path, key):
+    store = LocalDirectoryStore(str(tmp_path / "store"))
+    with pytest.raises(ValueError):
+        store.put(key, b"data")
+    with pytest.raises(ValueError):
+        store.get(key)
+
+
+def test_store_missing_methods_fail_when_built():
+    class GetOnly(ObjectStore):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
@@ -0,0 +1,83 @@
+import os
+import time
+from io import BytesIO
+
+import offload
+import pytest
+from flask import Flask
+from itsdangerous import TimestampSigner
+from object_store import LocalDirectoryStore
+
+PDF = b"%PDF-1.4\n" + b"x" * 4096
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = LocalDirectoryStore(str(tmp_path / "offload"))
+    monkeypatch.setattr(offload, "store", store)
+    monkeypatch.setattr(offload, "OFFLOAD_THRESHOLD", 1024)
+    return store
+
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+    app.secret_key = "test"
+
+    @app.route("/pdf/<int:size>/")
+    def pdf(size):
+        return offload.send_pdf(BytesIO(PDF[:size]), "dividers.pdf")
+
+    @app.route("/offloaded/<string:token>/")
+    def offloaded(token):
+        return offload.offloaded_response(token)
+
+    return app.test_client()
+
+
+def offloaded_url(client):
+    r = client.get(f"/pdf/{len(PDF)}/")
+    assert r.status_code == 303
+    return r.headers["Location"]
+
+
+def test_small_pdf_is_sent_directly(client, store):
+    r = client.get("/pdf/1024/")
+    assert r.status_code == 200
+    assert r.data == PDF[:1024]
+    assert os.listdir(store.root) == []
+
+
+def test_large_pdf_round_trip(client):
+    r = client.get(offloaded_url(client))
+    assert r.status_code == 200
+    assert r.mimetype == "application/pdf"
+    assert r.data == PDF
+    assert "dividers.pdf" in r.headers["Content-Disposition"]
+
+
+def test_tampered_token(client):
+    url = offloaded_url(client)
+    token = url.rstrip("/").rpartition("/")[2]
+    tampered = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    assert client.get(f"/offloaded/{tampered}/").status_code == 404
+
+
+def test_expired_token(client, monkeypatch):
+    # signed as long ago as the links last
+    signed_at = int(time.time()) - offload.OFFLOAD_URL_EXPIRES - 1
+    with monkeypatch.context() as m:
+        m.setattr(TimestampSigner, "get_timestamp", lambda self: signed_at)
+        url = offloaded_url(client)
+    assert client.get(url).status_code == 410
+
+
+def test_expired_pdfs_are_swept(client, store):
+    offloaded_url(client)
+    (old,) = os.listdir(store.root)
+    expired = time.time() - offload.OFFLOAD_URL_EXPIRES - 1
+    os.utime(os.path.join(store.root, old), (expired, expired))
+    offloaded_url(client)
+    remaining = os.listdir(store.root)
+    assert len(remaining) == 1
+    assert old not in remaining